@@ -93,6 +93,9 @@ def demo1():
 
     subbasins = [1]
 
+    # output.rch and output.sub are read once for all readers below
+    parsed = model3.parsedOutput()
+
     print("reader1 rch 1")
     reader1 = ReadOut.rchOutputManipulator(
         ["FLOW_OUT"],
@@ -103,6 +106,7 @@ def demo1():
         model3.working_dir,
         iprint="month",
         stats_dir=temp_dir,
+        parsed=parsed,
     )
     print(reader1.outValues["FLOW_OUT"][subbasins[0]])
 
@@ -122,6 +126,7 @@ def demo1():
         daysSkip=0,
         working_dir=model3.working_dir,
         iprint="month",
+        parsed=parsed,
     )
 
     print(f"efficiency.obs.min() {efficiency.obs.min()}")
@@ -148,11 +153,12 @@ def demo1():
         0,
         model3.working_dir,
         stats_dir=temp_dir,
+        parsed=parsed,
     )
     print(reader2.outValues)
 
     print("fluxes sub 1")
-    fluxes = ReadOut.fluxes("SURQ", subbasins, 1, model3.working_dir)
+    fluxes = ReadOut.fluxes("SURQ", subbasins, 1, model3.working_dir, parsed=parsed)
     print(fluxes.result())
 
 
@@ -342,14 +348,13 @@ class swat_callib_setup(object):
                 f"field {param_field} in file/manip {manip_ext} will be changed via '{changeHow}' and value {parameters[idx]} "
             )
             if len(field_list) > 3:
-                print(f"ignored constraints ({field_list[2:]})")
-
-            manipulator_handle = model.getFileManipulators()[manip_ext]
+                print(f"constraints ({field_list[3:]})")
 
             # here we could add addtional conditions for finer granularity
-            for m in manipulator_handle:
-                m.setChangePar(param_field, parameters[idx], changeHow)
-                m.finishChangePar()
+            model.changeParameter(param_string.name, parameters[idx])
+
+        # every changed file is written once with all of its changes
+        model.commitParameterChanges()
 
     def parameters(self):
         return spotpy.parameter.generate(self.params)
@@ -11,7 +11,7 @@ import numpy as np
 import pandas as pd
 
 import spotpy
-from swatpy import SimManage, ReadOut, FileEdit
+from swatpy import SimManage, ReadOut, FileEdit, ResultCache
 
 import logging
 import datetime
@@ -37,8 +37,6 @@ def update_SLSOIL(mpath):
     )
     logger.info(model3.working_dir)
 
-    manipulators = model3.getFileManipulators()
-
     """
     Instruction to edit SLSOIL
 
@@ -47,9 +45,8 @@ def update_SLSOIL(mpath):
     """
 
     # hrufiles SLSUBBSN -> SLSOIL
-    for hruMan in manipulators["hru"]:
-        hruMan.setChangePar("SLSOIL", hruMan.parValue["SLSUBBSN"][0], "s")
-        hruMan.finishChangePar()
+    with model3.parameterTransaction():
+        model3.setParameterValues("hru", "SLSOIL", model3.parameterValues("hru", "SLSUBBSN"))
 
     logger.info("after reload()")
     manip2 = model3.reloadFileManipulators()
@@ -71,8 +68,6 @@ def update_LAT_TTIME(mpath):
         mpath, copy=False, target_dir=None, swat_version="2012", force=True
     )
     logger.info(model3.working_dir)
-
-    manipulators = model3.getFileManipulators()
     """
     Instruction to edit LAT_TTIME
 
@@ -90,23 +85,15 @@ def update_LAT_TTIME(mpath):
     After replacing the values of SLSOIL and LAT_TTIME, rewrite the hru file before running SWAT.
     """
 
-    # hrufiles set LAT_TTIME
-    for hruMan in manipulators["hru"]:
-        hru_id = hruMan.filename.strip().split(".")[0]
-        SLSOIL_val = hruMan.parValue["SLSOIL"][0]
-        LAT_TTIME_val = hruMan.parValue["LAT_TTIME"][0]
-
-        SOL_K_MAX = 1
-        for solMan in manipulators["sol"]:
-            sol_id = solMan.filename.strip().split(".")[0]
-            if sol_id == hru_id:
-                SOL_K = solMan.parValue["SOL_K"]
-                SOL_K_MAX = np.array(SOL_K).max()
+    # hrufiles set LAT_TTIME, joined with the highest SOL_K of the soil of each HRU
+    SLSOIL_val = model3.parameterValues("hru", "SLSOIL")
+    LAT_TTIME_val = model3.parameterValues("hru", "LAT_TTIME")[-1]
 
-        LAT_TTIME_val_new = 10.4 * (SLSOIL_val / SOL_K_MAX)
+    SOL_K_MAX = model3.parameterValues("sol", "SOL_K", how="max", join="hru")
+    SOL_K_MAX = np.where(np.isnan(SOL_K_MAX), 1, SOL_K_MAX)
 
-        hruMan.setChangePar("LAT_TTIME", LAT_TTIME_val_new, "s")
-        hruMan.finishChangePar()
+    with model3.parameterTransaction():
+        model3.setParameterValues("hru", "LAT_TTIME", 10.4 * (SLSOIL_val / SOL_K_MAX))
 
     logger.info("after reload()")
     manip2 = model3.reloadFileManipulators()
@@ -124,7 +111,16 @@ def update_LAT_TTIME(mpath):
 
 class swat_callib_setup(object):
     def __init__(
-        self, swat_model, observed_data, param_defs, parallel="seq", temp_dir=None
+        self,
+        swat_model,
+        observed_data,
+        param_defs,
+        parallel="seq",
+        temp_dir=None,
+        use_pool=True,
+        run_timeout=None,
+        stall_timeout=None,
+        cache_dir=None,
     ):
 
         self.model = swat_model
@@ -143,6 +139,13 @@ class swat_callib_setup(object):
 
         self.temp_dir = temp_dir
         self.parallel = parallel
+        self.run_timeout = run_timeout
+        self.stall_timeout = stall_timeout
+
+        # simulation results of already seen parameter sets, shared by reruns of a campaign
+        self.cache = None
+        if not cache_dir is None:
+            self.cache = ResultCache.ResultCache(cache_dir, max_bytes=2 * 1024**3)
 
         if self.parallel == "seq":
             pass
@@ -155,6 +158,13 @@ class swat_callib_setup(object):
             self.mpi_size = comm.Get_size()
             self.mpi_rank = comm.Get_rank()
 
+        # one reusable sandbox per process instead of a full copy per simulation
+        self.pool = None
+        if use_pool:
+            self.pool = SimManage.SwatModelPool(
+                self.model, size=1, root_dir=self.temp_dir, link="symlink"
+            )
+
     def onerror(self, func, path, exc_info):
 
         if not os.access(path, os.W_OK):
@@ -255,14 +265,12 @@ class swat_callib_setup(object):
                 f"field {param_field} in file/manip {manip_ext} will be changed via '{changeHow}' and value {parameters[idx]} "
             )
             if len(field_list) > 3:
-                logger.info(f"ignored constraints ({field_list[2:]})")
+                logger.info(f"constraints ({field_list[3:]})")
 
-            manipulator_handle = model.getFileManipulators()[manip_ext]
+            model.changeParameter(param_string.name, parameters[idx])
 
-            # here we could add addtional conditions for finer granularity
-            for m in manipulator_handle:
-                m.setChangePar(param_field, parameters[idx], changeHow)
-                m.finishChangePar()
+        # every changed file is written once with all of its changes
+        model.commitParameterChanges()
 
     def parameters(self):
         return spotpy.parameter.generate(self.params)
@@ -274,37 +282,69 @@ class swat_callib_setup(object):
 
     # Simulation function must not return values besides for which evaluation values/observed data are available
     def simulation(self, parameters):
-        the_model = self.prep_temp_model_dir()
-        the_model.enrichModelMeta(verbose=False)
-        if the_model.is_runnable() == 0:
-            logger.info(
-                f"{the_model.swat_exec} is NOT runnable: {the_model.is_runnable()}"
-            )
+        outputs = [("rch", "FLOW_OUT", 1)]
+        if not self.cache is None:
+            parameter_set = {
+                param.name: parameters[idx] for idx, param in enumerate(self.params)
+            }
+            cache_key = self.cache.key(self.model, parameter_set, outputs)
+            cached = self.cache.get(cache_key)
+            if not cached is None:
+                logger.info(f"cached simulation {cache_key}")
+                return cached[outputs[0]]
+
+        if self.pool is None:
+            the_model = self.prep_temp_model_dir()
+        else:
+            the_model = self.pool.checkout()
+        try:
+            the_model.enrichModelMeta(verbose=False)
+            if the_model.is_runnable() == 0:
+                logger.info(
+                    f"{the_model.swat_exec} is NOT runnable: {the_model.is_runnable()}"
+                )
 
-        self.manipulate_model_params(the_model, parameters)
-
-        # TODO: edit the correct parameters in SWAT files
-
-        ret_val = the_model.run(capture_logs=False, silent=False)
-        logger.info(f"returns {ret_val} - vs {the_model.last_run_succesful}")
-        # logger.info(model4.last_run_logs)
-
-        reach = 1
-        # simulated data
-        reader1 = ReadOut.rchOutputManipulator(
-            ["FLOW_OUT"],
-            [reach],
-            "skip",
-            True,
-            0,
-            the_model.working_dir,
-            iprint="month",
-            stats_dir=self.temp_dir,
-        )
-        sim_flow_1 = reader1.outValues["FLOW_OUT"][reach]
+            self.manipulate_model_params(the_model, parameters)
+
+            # TODO: edit the correct parameters in SWAT files
 
-        # cleanup
-        self.remove_temp_model_dir(the_model)
+            ret_val = the_model.run(
+                capture_logs=False,
+                silent=False,
+                timeout=self.run_timeout,
+                stall_timeout=self.stall_timeout,
+            )
+            logger.info(
+                f"returns {ret_val} - vs {the_model.last_run_succesful} ({the_model.last_run_status})"
+            )
+            # logger.info(model4.last_run_logs)
+
+            if the_model.last_run_succesful:
+                reach = 1
+                # simulated data
+                reader1 = ReadOut.rchOutputManipulator(
+                    ["FLOW_OUT"],
+                    [reach],
+                    "skip",
+                    True,
+                    0,
+                    the_model.working_dir,
+                    iprint="month",
+                    stats_dir=self.temp_dir,
+                    parsed=the_model.parsedOutput(),
+                )
+                sim_flow_1 = reader1.outValues["FLOW_OUT"][reach]
+                if not self.cache is None:
+                    self.cache.put(cache_key, {outputs[0]: np.array(sim_flow_1)})
+            else:
+                # killed or crashed runs get a nan simulation so the sampler can move on
+                sim_flow_1 = np.full(len(self.observed_data), np.nan)
+        finally:
+            # cleanup, also if the run or the readout raised, the pool has to get the sandbox back
+            if self.pool is None:
+                self.remove_temp_model_dir(the_model)
+            else:
+                self.pool.checkin(the_model)
         return sim_flow_1
 
     # if we want to minimize our function, we can select a negative objective function
@@ -404,6 +444,9 @@ def model_callib(model, mpath, param_file, sampler, repetitions, parallel):
 
     spot_sampler.sample(repetitions)
 
+    if spot_setup.pool is not None:
+        spot_setup.pool.close()
+
     try:
         shutil.rmtree(target_dir)
     except Exception as e:
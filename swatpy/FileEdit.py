@@ -63,8 +63,9 @@ initParValue        reads initial values from input files, these
                     several times in the file (e.g. ".sol")
                     (below called: "multi paramter problem")
 
-prepareChangePar    copies text of file to be changed and stored
-                    as the manipulated file later on;
+prepareChangePar    discards the text to be stored as the manipulated
+                    file later on, a copy of the original text
+                    ("textNew") is only made on the first change;
                     is automatically called after each file
                     manipulation by "finishChangePar"
 
@@ -99,6 +100,9 @@ Calling "f.finishChangePar() twice resets the original file
 
 
 class InputFileManipulator(object):
+    # the file is kept as one bytes buffer, its lines are only split on
+    # demand (see line and textOld) and textNew only exists once changed
+    __slots__ = ("filename", "file_enc", "working_dir", "buffer", "buffer_enc", "lineEnds", "_textNew", "parValue")
 
     # connect Object with a SWAT input file
     def __init__(self, filename, parList, working_dir, encoding='latin-1'):
@@ -109,21 +113,62 @@ class InputFileManipulator(object):
         #		core_nr = str(int(os.environ['OMPI_COMM_WORLD_RANK'])) # +1 to prevent zero if necessary...
         #        except KeyError:
         #		core_nr = str(int(np.random.uniform(0,1000))) # if you run on windows
-        ffile = open(os.path.join(self.working_dir, self.filename), "r", encoding=self.file_enc)
-        self.textOld = ffile.readlines()
+        ffile = open(os.path.join(self.working_dir, self.filename), "rb")
+        self.buffer = ffile.read()
         ffile.close()
+        self.buffer_enc = self.file_enc
+        if "\n".encode(self.file_enc) != b"\n":
+            # lines can only be found in the bytes of single byte newline encodings
+            self.buffer = self.buffer.decode(self.file_enc).encode("utf-8")
+            self.buffer_enc = "utf-8"
+        ends = np.flatnonzero(np.frombuffer(self.buffer, dtype=np.uint8) == 10) + 1
+        if len(ends) == 0 or ends[-1] != len(self.buffer):
+            ends = np.append(ends, len(self.buffer))
+        self.lineEnds = ends.astype(np.uint32 if len(self.buffer) < 2 ** 32 else np.int64)
+        self._textNew = None
         self.initParValue(parList)
         self.prepareChangePar()
 
+    # a line of the original file, as in readlines (with "\n" line endings)
+    def line(self, index):
+        if index < 0:
+            index += len(self.lineEnds)
+        start = int(self.lineEnds[index - 1]) if index > 0 else 0
+        text = self.buffer[start:int(self.lineEnds[index])].decode(self.buffer_enc)
+        if text.endswith("\r\n"):
+            text = text[:-2] + "\n"
+        return text
+
+    # the lines of the original file, split anew on each access
+    @property
+    def textOld(self):
+        return [self.line(index) for index in range(len(self.lineEnds))]
+
+    # the changed lines, only materialized on the first change
+    @property
+    def textNew(self):
+        if self._textNew is None:
+            self._textNew = self.textOld
+        return self._textNew
+
+    @textNew.setter
+    def textNew(self, text):
+        self._textNew = text
+
     # should be overridden if one parameter exists several times in each file, e.g. for different soil layers
     def initParValue(self, parList):
         # initial parameters --> parValue of subclass
         for namePar in parList:
             row, col1, col2, dig = self.parInfo[namePar]
-            self.parValue[namePar] = [float(self.textOld[row - 1][col1:col2])]
+            self.parValue[namePar] = [float(self.line(row - 1)[col1:col2])]
+
+    # the initial values of one parameter of parInfo, also of one that is not in parList
+    def readParValue(self, namePar):
+        row, col1, col2, dig = self.parInfo[namePar]
+        return [float(self.line(row - 1)[col1:col2])]
 
     def prepareChangePar(self):
-        self.textNew = self.textOld[:]  # copy instead of new name allocation
+        self._textNew = None  # a copy of textOld is only made on the first change
 
     # built to be overridden if one parameter exists several times in each file, e.g. for different soil layers
     def setChangePar(self, namePar, changePar, changeHow):
@@ -160,9 +205,15 @@ class InputFileManipulator(object):
         #	core_nr = str(int(os.environ['OMPI_COMM_WORLD_RANK'])) # +1 to prevent zero if necessary...
         #  except KeyError:
         #	core_nr = str(int(np.random.uniform(0,10000))) # if you run on windows
-        ffile = open(os.path.join(self.working_dir,  self.filename), "w", encoding=self.file_enc)
-        ffile.writelines(self.textNew)
-        ffile.close
+        if self._textNew is None:
+            # unchanged, the original file is restored
+            ffile = open(os.path.join(self.working_dir, self.filename), "wb")
+            ffile.write(self.buffer if self.buffer_enc == self.file_enc else
+                        self.buffer.decode(self.buffer_enc).encode(self.file_enc))
+        else:
+            ffile = open(os.path.join(self.working_dir,  self.filename), "w", encoding=self.file_enc)
+            ffile.writelines(self._textNew)
+        ffile.close()
         self.prepareChangePar()
 
 
@@ -172,6 +223,8 @@ class InputFileManipulator(object):
 
 
 class bsnManipulator(InputFileManipulator):
+    __slots__ = ()
+
     # information about parameters:
     # (1)row in file, (2) first and (3) last relevant column in row
     # and (4) digits
@@ -421,6 +474,8 @@ class bsnManipulator(InputFileManipulator):
 
 
 class gwManipulator(InputFileManipulator):
+    __slots__ = ("landuse", "subbasin")
+
     # information about parameters:
     # (1)row in file, (2) first and (3) last relevant column in row
     # and (4) digits
@@ -461,8 +516,8 @@ class gwManipulator(InputFileManipulator):
                       "LAT_ORGP": None,
                       "ALPHA_BF_D": None}
         InputFileManipulator.__init__(self, filename, parList, working_dir, encoding)
-        self.landuse = self.textOld[0].split(" ")[7].split(":")[1]
-        self.subbasin = self.textOld[0].split(" ")[5].split(":")[1]
+        self.landuse = self.line(0).split(" ")[7].split(":")[1]
+        self.subbasin = self.line(0).split(" ")[5].split(":")[1]
 
 
 """
@@ -471,6 +526,8 @@ class gwManipulator(InputFileManipulator):
 
 
 class mgtManipulator(InputFileManipulator):
+    __slots__ = ("landuse", "subbasin")
+
     # information about parameters:
     # (1)row in file, (2) first and (3) last relevant column in row
     # and (4) digits
@@ -522,8 +579,8 @@ class mgtManipulator(InputFileManipulator):
                       "GDRAIN": None,
                       "NROT": None}
         InputFileManipulator.__init__(self, filename, parList, working_dir, encoding)
-        self.landuse = self.textOld[0].split(" ")[7].split(":")[1]
-        self.subbasin = self.textOld[0].split(" ")[5].split(":")[1]
+        self.landuse = self.line(0).split(" ")[7].split(":")[1]
+        self.subbasin = self.line(0).split(" ")[5].split(":")[1]
 
 
 """
@@ -532,6 +589,8 @@ class mgtManipulator(InputFileManipulator):
 
 
 class subManipulator(InputFileManipulator):
+    __slots__ = ()
+
     # information about parameters:
     # (1)row in file, (2) first and (3) last relevant column in row
     # and (4) digits
@@ -559,12 +618,48 @@ class subManipulator(InputFileManipulator):
         InputFileManipulator.__init__(self, filename, parList, working_dir, encoding)
 
 
+class SubbasinTable(object):
+    # parameters of the ".sub" files of a model, shared by all hruManipulators;
+    # each file is parsed on first use and parsed again once it was changed
+    # (its size or modification time differ, or it was passed to invalidate)
+
+    def __init__(self, working_dir, encoding='latin-1', parList=None):
+        self.working_dir = working_dir
+        self.file_enc = encoding
+        self.parList = list(subManipulator.parInfo) if parList is None else parList
+        self.entries = {}
+
+    @staticmethod
+    def filename(subbasin):
+        return str(subbasin).strip().zfill(5) + "0000.sub"
+
+    def parValue(self, subbasin):
+        filename = self.filename(subbasin)
+        st = os.stat(os.path.join(self.working_dir, filename))
+        state = (st.st_size, st.st_mtime_ns)
+        entry = self.entries.get(filename)
+        if entry is None or entry[0] != state:
+            entry = (state, subManipulator(filename, list(self.parList), self.working_dir, self.file_enc).parValue)
+            self.entries[filename] = entry
+        return entry[1]
+
+    def get(self, subbasin, namePar):
+        return self.parValue(subbasin)[namePar][0]
+
+    def invalidate(self, filenames):
+        # files written in place, their stat may not change
+        for filename in filenames:
+            self.entries.pop(filename, None)
+
+
 """
 
 """
 
 
 class hruManipulator(InputFileManipulator):
+    __slots__ = ("landuse", "subbasin", "subTable")
+
     # information about parameters:
     # (1)row in file, (2) first and (3) last relevant column in row
     # and (4) digits
@@ -610,7 +705,8 @@ class hruManipulator(InputFileManipulator):
                "R2ADJ": (45, 1, 16, 2)}
 
     # expands init-method of FileManipulator to generate parValue-dictionaries for individual instances
-    def __init__(self, filename, parList, working_dir, encoding='latin-1'):
+    # subTable -- SubbasinTable shared by the hruManipulators of a model (default: an own one)
+    def __init__(self, filename, parList, working_dir, encoding='latin-1', subTable=None):
         self.parValue = {"HRU_FR": None,
                       "SLSUBBSN": None,
                       "HRU_SLP": None,
@@ -654,13 +750,16 @@ class hruManipulator(InputFileManipulator):
         if "HRU_FR" not in parList:
             parList.append("HRU_FR")
         InputFileManipulator.__init__(self, filename, parList, working_dir, encoding)
-        self.landuse = self.textOld[0].split(" ")[7].split(":")[1]
-        self.subbasin = self.textOld[0].split(" ")[5].split(":")[1]
-        zeros = "0"
-        zeros *= 5 - len(self.subbasin)
-        filename_subbasin = zeros + self.subbasin + "0000.sub"
-        self.hru_abs = subManipulator(filename_subbasin, ["SUB_KM"], working_dir).parValue["SUB_KM"][0]
-        self.hru_abs *= self.parValue["HRU_FR"][0]
+        self.landuse = self.line(0).split(" ")[7].split(":")[1]
+        self.subbasin = self.line(0).split(" ")[5].split(":")[1]
+        if subTable is None:
+            subTable = SubbasinTable(working_dir, encoding)
+        self.subTable = subTable
+
+    # area of the HRU, from the (shared) area of its subbasin
+    @property
+    def hru_abs(self):
+        return self.subTable.get(self.subbasin, "SUB_KM") * self.parValue["HRU_FR"][0]
 
 
 """
@@ -669,6 +768,9 @@ class hruManipulator(InputFileManipulator):
 
 
 class solManipulator(InputFileManipulator):
+    __slots__ = ("parValueMean", "landuse", "fieldCapacity", "saturationVolume", "airCapacity",
+                 "layerNames", "layerValues")
+
     # information about parameters:
     # (1)row in file, (2) first and (3) last relevant column in row
     # and (4) digits
@@ -734,33 +836,54 @@ class solManipulator(InputFileManipulator):
             parList.append("CLAY")
         InputFileManipulator.__init__(self, filename, parList, working_dir, encoding)
         self.calculateParValueMean(parList)
-        self.landuse = self.textOld[0].split(" ")[7].split(":")[1]
+        self.landuse = self.line(0).split(" ")[7].split(":")[1]
 
         n_horizons = len(self.parValue["SOL_Z"])
-        self.fieldCapacity = []
-        self.saturationVolume = []
-        self.airCapacity = []
-        for horizon in range(n_horizons):
-            awc = self.parValue["SOL_AWC"][horizon]
-            bd = self.parValue["SOL_BD"][horizon]
-            clay = self.parValue["CLAY"][horizon]
-            self.fieldCapacity.append(awc + 0.4 * clay / 100.0 * bd)
-            self.saturationVolume.append(1 - bd / 2.65)
-            self.airCapacity.append((1 - bd / 2.65) - (awc + 0.4 * clay / 100.0 * bd))
+        awc = self.layerValues[:n_horizons, self.layerNames.index("SOL_AWC")]
+        bd = self.layerValues[:n_horizons, self.layerNames.index("SOL_BD")]
+        clay = self.layerValues[:n_horizons, self.layerNames.index("CLAY")]
+        fieldCapacity = awc + 0.4 * clay / 100.0 * bd
+        saturationVolume = 1 - bd / 2.65
+        self.fieldCapacity = fieldCapacity.tolist()
+        self.saturationVolume = saturationVolume.tolist()
+        self.airCapacity = (saturationVolume - fieldCapacity).tolist()
 
     # overrides method of FileManipulator: multiple soil layers have to be considered.
+    # The values of all layers of all requested properties are converted at once
+    # into layerValues (layers x properties, NaN beyond the last layer of a property).
     def initParValue(self, parList):
         # initial parameters --> parValue of subclass
+        self.layerNames = []
+        segments = []
+        n_layers = []
         for namePar in parList:
             row, col1, col2, dig = self.parInfo[namePar]
-            llist = []
-            llist.append(float(self.textOld[row - 1][col1:col2]))
-            if row > 7:
-                while len(self.textOld[row - 1]) > col2 + 3:
-                    col1 += 12
-                    col2 += 12
-                    llist.append(float(self.textOld[row - 1][col1:col2]))
-            self.parValue[namePar] = llist
+            line = self.line(row - 1)
+            if row <= 7:
+                self.parValue[namePar] = [float(line[col1:col2])]
+                continue
+            # further layers follow every 12 characters, as long as the line is longer than col2 + 3
+            n_layers.append(1 + max(0, (len(line) - col2 - 4) // 12 + 1))
+            segments.append((line, col1))
+            self.layerNames.append(namePar)
+
+        n_max = max(n_layers, default=0)
+        empty = "nan".rjust(11) + " "
+        text = "".join([line[col1:col1 + 12 * n].ljust(12 * n) + empty * (n_max - n)
+                        for (line, col1), n in zip(segments, n_layers)])
+        fields = np.frombuffer(text.encode("ascii", "replace"), dtype="S12").reshape(len(segments), n_max)
+        self.layerValues = fields.astype("S11").astype(float).T
+        for j, namePar in enumerate(self.layerNames):
+            self.parValue[namePar] = self.layerValues[:n_layers[j], j].tolist()
+
+    # overrides readParValue: one value per soil layer, as in initParValue
+    def readParValue(self, namePar):
+        row, col1, col2, dig = self.parInfo[namePar]
+        line = self.line(row - 1)
+        if row <= 7:
+            return [float(line[col1:col2])]
+        n_layers = 1 + max(0, (len(line) - col2 - 4) // 12 + 1)
+        return [float(line[col1 + 12 * i:col1 + 12 * i + 11]) for i in range(n_layers)]
 
     # overrides setChangePar: multiple soil layers have to be considered.
     def setChangePar(self, namePar, changePar, changeHow):
@@ -784,6 +907,16 @@ class solManipulator(InputFileManipulator):
     # calculates averaged parameter values for the whole soil profile weighted by the depth of each horizon
     def calculateParValueMean(self, parList):
         n_horizons = len(self.parValue["SOL_Z"])
+        if n_horizons > 1:
+            # all properties at once, summed layer by layer
+            depth = self.layerValues[:n_horizons, self.layerNames.index("SOL_Z")]
+            thickness = depth.copy()
+            thickness[1:] -= depth[:-1]
+            weighted = self.layerValues[:n_horizons] * thickness[:, None]
+            means = weighted[0].copy()
+            for n in range(1, n_horizons):
+                means += weighted[n]
+            means = (means / depth[-1]).tolist()
         for par in parList:
             if par == "SOL_Z":
                 self.parValueMean[par] = self.parValue[par][n_horizons - 1]
@@ -791,14 +924,11 @@ class solManipulator(InputFileManipulator):
                 if n_horizons == 1:
                     self.parValueMean[par] = self.parValue[par][0]
                 else:
-                    valueMean = self.parValue[par][0] * self.parValue["SOL_Z"][0]
-                    for n in range(1, n_horizons):
-                        valueMean += self.parValue[par][n] * (self.parValue["SOL_Z"][n] - self.parValue["SOL_Z"][n - 1])
-                    valueMean /= self.parValue["SOL_Z"][n_horizons - 1]
-                    self.parValueMean[par] = valueMean
+                    self.parValueMean[par] = means[self.layerNames.index(par)]
 
 
 class solManipulationCorrection(solManipulator):
+    __slots__ = ()
 
     def __init__(self, filename, working_dir, encoding='latin-1'):
         parList = ["CLAY", "SILT", "SAND"]
@@ -814,6 +944,7 @@ class solManipulationCorrection(solManipulator):
 
 
 class solManipulationCheck(solManipulator):
+    __slots__ = ("ok",)
 
     def __init__(self, filename, working_dir, encoding='latin-1'):
         parList = ["SOL_AWC", "SOL_BD", "CLAY"]
@@ -827,6 +958,8 @@ class solManipulationCheck(solManipulator):
 
 
 class rteManipulator(InputFileManipulator):
+    __slots__ = ("subbasin",)
+
     # information about parameters:
     # (1)row in file, (2) first and (3) last relevant column in row
     # and (4) digits
@@ -880,10 +1013,12 @@ class rteManipulator(InputFileManipulator):
                       "CH_BED_TC": None,
                       "CH_EQ": None}
         InputFileManipulator.__init__(self, filename, parList, working_dir, encoding)
-        self.subbasin = self.textOld[0].split(" ")[3].split(":")[0]
+        self.subbasin = self.line(0).split(" ")[3].split(":")[0]
 
 
 class fileCioManipulator(InputFileManipulator):
+    __slots__ = ()
+
     # information about parameters:
     # (1)row in file, (2) first and (3) last relevant column in row
     # and (4) digits
@@ -899,3 +1034,46 @@ class fileCioManipulator(InputFileManipulator):
                       "IPRINT": None,
                       "NYSKIP": None}
         InputFileManipulator.__init__(self, filename, parList, working_dir, encoding)
+
+
+class LazyManipulator(object):
+    # stands in for a manipulator of one file; the manipulator is only
+    # created (and its file parsed) on the first attribute access,
+    # e.g. when a parameter is read or changed
+    __slots__ = ("manipulatorClass", "filename", "parList", "working_dir", "file_enc", "kwargs", "manipulator")
+
+    # kwargs -- further arguments of the manipulator class, e.g. subTable
+    def __init__(self, manipulatorClass, filename, parList, working_dir, encoding='latin-1', **kwargs):
+        object.__setattr__(self, "manipulatorClass", manipulatorClass)
+        object.__setattr__(self, "filename", filename)
+        object.__setattr__(self, "parList", parList)
+        object.__setattr__(self, "working_dir", working_dir)
+        object.__setattr__(self, "file_enc", encoding)
+        object.__setattr__(self, "kwargs", kwargs)
+        object.__setattr__(self, "manipulator", None)
+
+    def load(self):
+        if self.manipulator is None:
+            object.__setattr__(self, "manipulator", self.manipulatorClass(self.filename, self.parList, self.working_dir,
+                                                                          self.file_enc, **self.kwargs))
+        return self.manipulator
+
+    def isLoaded(self):
+        return not self.manipulator is None
+
+    def __getattr__(self, name):
+        # only called for attributes of the real manipulator
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.load(), name, value)
+
+    # pickle restores the slots without __setattr__, which would load the file
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in LazyManipulator.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
@@ -0,0 +1,406 @@
+# ParameterTable.py
+
+""" columnar store of the parameters of all input files of one type
+
+    The initial values of all manipulators of a file type are collected
+    into one array with one row per file (per soil layer for ".sol") and
+    one column per parameter. Parameter changes ("+", "*", "s", see
+    InputFileManipulator.changePar) are computed as array operations for
+    all files at once; "write" then formats the changed values and writes
+    every affected file once.
+
+    Like the manipulators, changes are always relative to the initial
+    values and are discarded after "write".
+
+    On the first "write" an edit plan is compiled, which resolves every
+    value to its absolute byte offset in its file. Changed values are then
+    patched in place (values changed by the previous write are set back to
+    their initial bytes), only a file in which a value does not fit its
+    field width is rewritten as a whole, as "changePar" would do.
+
+"""
+
+import os
+import re
+import collections
+import numpy as np
+
+# "Key:value" pairs of the header line of HRU level input files
+HEADER_ATTRIBUTE = re.compile(r"(\w+):\s*(\S+)")
+
+
+def patchFile(path, patches):
+    # writes (offset, bytes) patches into a file in place
+    fd = os.open(path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        for offset, data in patches:
+            if hasattr(os, "pwrite"):
+                os.pwrite(fd, data, int(offset))
+            else:
+                os.lseek(fd, int(offset), os.SEEK_SET)
+                os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+class ParameterTable(object):
+
+    # manipulators -- list of manipulators (or LazyManipulator) of one file type
+    def __init__(self, manipulators):
+        self.manipulators = manipulators
+        self.n_files = len(manipulators)
+        if self.n_files == 0:
+            self.parInfo = {}
+            self.parNames = []
+        else:
+            self.parInfo = manipulators[0].parInfo
+            self.parNames = [p for p, v in manipulators[0].parValue.items() if not v is None]
+        self.columns = {p: j for j, p in enumerate(self.parNames)}
+        self.filenames = [m.filename for m in manipulators]
+        self.stems = [f.split(".")[0] for f in self.filenames]
+
+        # soil layers are stored side by side, 12 characters apart
+        n_layers = np.ones(self.n_files, dtype=int)
+        for f, m in enumerate(manipulators):
+            n_layers[f] = max([len(m.parValue[p]) for p in self.parNames] + [1])
+        self.layerOffset = 12 if n_layers.max(initial=1) > 1 else 0
+        starts = np.cumsum(n_layers) - n_layers
+        self.fileRows = np.stack((starts, n_layers), axis=1)
+        self.rowFile = np.repeat(np.arange(self.n_files), n_layers)
+        self.rowLayer = np.arange(len(self.rowFile)) - np.repeat(starts, n_layers)
+
+        self.values = np.full((len(self.rowFile), len(self.parNames)), np.nan)
+        for f, m in enumerate(manipulators):
+            for j, p in enumerate(self.parNames):
+                v = m.parValue[p]
+                self.values[starts[f]:starts[f] + len(v), j] = v
+        self.present = ~np.isnan(self.values)
+        # number of values of each parameter per file, e.g. the soil layers
+        self.n_values = np.stack([np.bincount(self.rowFile[self.present[:, j]], minlength=self.n_files)
+                                  for j in range(len(self.parNames))], axis=1) if self.parNames else None
+
+        self.newValues = self.values.copy()
+        self.changed = np.zeros(self.values.shape, dtype=bool)
+        self.order = []
+
+        # edit plan, see compile
+        self.offsets = None
+        self.originalFields = None
+        self.onDisk = np.zeros(self.values.shape, dtype=bool)
+        self.shifted = np.zeros(self.n_files, dtype=bool)
+
+    def columnIndex(self, namePar):
+        # parameters of parInfo, which are not in the parList of the manipulators, are added on first use
+        if not namePar in self.columns:
+            self.addColumn(namePar)
+        return self.columns[namePar]
+
+    def addColumn(self, namePar):
+        """adds a parameter of parInfo, which is not in the parList of the manipulators
+
+        The initial values are parsed from the files (see InputFileManipulator.readParValue)
+        and also kept in the parValue of every manipulator.
+
+        Return: index of the new column
+        """
+        # a type without files has no parInfo, it gets an empty column
+        if self.n_files > 0 and not namePar in self.parInfo:
+            raise KeyError(namePar)
+        column = np.full((len(self.rowFile), 1), np.nan)
+        for f, m in enumerate(self.manipulators):
+            v = m.readParValue(namePar)
+            m.parValue[namePar] = v
+            start, n_rows = self.fileRows[f]
+            column[start:start + min(len(v), n_rows), 0] = v[:n_rows]
+        present = ~np.isnan(column)
+
+        j = len(self.parNames)
+        self.parNames.append(namePar)
+        self.columns[namePar] = j
+        self.values = np.hstack((self.values, column))
+        self.present = np.hstack((self.present, present))
+        n_values = np.bincount(self.rowFile[present[:, 0]], minlength=self.n_files)[:, None]
+        self.n_values = n_values if self.n_values is None else np.hstack((self.n_values, n_values))
+        self.newValues = np.hstack((self.newValues, column))
+        self.changed = np.hstack((self.changed, np.zeros(present.shape, dtype=bool)))
+        self.onDisk = np.hstack((self.onDisk, np.zeros(present.shape, dtype=bool)))
+        if not self.offsets is None:
+            self.offsets = np.hstack((self.offsets, np.full(present.shape, -1, dtype=np.int64)))
+            self.originalFields = np.hstack((self.originalFields, np.empty(present.shape, dtype=object)))
+            self.compile([j])
+        return j
+
+    def column(self, namePar):
+        return self.values[:, self.columnIndex(namePar)]
+
+    def fileValues(self, namePar, how="first"):
+        """one value per file, including the changes not written yet
+
+        Keyword arguments:
+        how -- "first" (top soil layer), "max", "min" or "sum" over the soil layers
+        Return: array over the files, NaN if a file has no value
+        """
+        j = self.columnIndex(namePar)
+        rows = np.flatnonzero(self.present[:, j])
+        values = np.full(self.n_files, np.nan)
+        if how == "first":
+            rows = rows[self.rowLayer[rows] == 0]
+            values[self.rowFile[rows]] = self.newValues[rows, j]
+        elif how in ("max", "min", "sum"):
+            ufunc = {"max": np.fmax, "min": np.fmin, "sum": np.add}[how]
+            values[np.unique(self.rowFile[rows])] = {"max": -np.inf, "min": np.inf, "sum": 0.0}[how]
+            ufunc.at(values, self.rowFile[rows], self.newValues[rows, j])
+        else:
+            raise ValueError("unknown aggregation: " + str(how))
+        return values
+
+    def joinFiles(self, other):
+        # position of the file with the same id (e.g. 000010001) in other per file, -1 if missing
+        positions = {stem: i for i, stem in enumerate(other.stems)}
+        return np.array([positions.get(stem, -1) for stem in self.stems], dtype=int)
+
+    # files -- optional boolean mask or indices of the files to be changed
+    def change(self, namePar, changePar, changeHow, files=None):
+        j = self.columnIndex(namePar)
+        rows = self.present[:, j].copy()
+        if not files is None:
+            selected = np.zeros(self.n_files, dtype=bool)
+            selected[files] = True
+            rows &= selected[self.rowFile]
+        if not rows.any():
+            # e.g. a constraint matching no HRU
+            return
+
+        base = self.values[rows, j]
+        changePar = np.asarray(changePar, dtype=float)
+        if changePar.ndim > 0:
+            # one value per file
+            changePar = changePar[self.rowFile[rows]]
+        if changeHow == "+":
+            changed = base + changePar
+        elif changeHow == "*":
+            changed = base + base * changePar
+        elif changeHow == "s":
+            if namePar == "SOL_Z":
+                # all horizons get the same depth
+                n_par = self.n_values[self.rowFile[rows], j]
+                changed = changePar * (self.rowLayer[rows] + 1) / n_par
+            else:
+                changed = np.broadcast_to(changePar, base.shape)
+        else:
+            raise ValueError("unknown change method: " + str(changeHow))
+
+        self.newValues[rows, j] = changed
+        self.changed[rows, j] = True
+        if not j in self.order:
+            self.order.append(j)
+
+    def fieldLayout(self, j, r):
+        # character positions of the value of row r in column j
+        row, col1, col2, dig = self.parInfo[self.parNames[j]]
+        offset = int(self.rowLayer[r]) * self.layerOffset
+        return row - 1, col1 - 1 + offset, col2 + offset
+
+    def compile(self, columns=None):
+        """resolves every value to the byte offset of its field in its file
+
+        Values whose field on disk does not match the initial text (e.g. the
+        file was changed by other means) get no offset and are written by
+        rewriting the file.
+
+        Keyword arguments:
+        columns -- optional indices of the columns to resolve (e.g. one added
+                   by addColumn), all columns if not given
+        """
+        if columns is None:
+            self.offsets = np.full(self.values.shape, -1, dtype=np.int64)
+            self.originalFields = np.empty(self.values.shape, dtype=object)
+            columns = range(len(self.parNames))
+        for f, m in enumerate(self.manipulators):
+            with open(os.path.join(m.working_dir, m.filename), "rb") as ffile:
+                lines = ffile.read().splitlines(keepends=True)
+            lineStarts = np.concatenate(([0], np.cumsum([len(line) for line in lines])))
+            for r in np.flatnonzero(self.rowFile == f).tolist():
+                for j in [j for j in columns if self.present[r, j]]:
+                    row, start, end = self.fieldLayout(j, r)
+                    line = m.line(row)
+                    field = line[start:end].encode(m.file_enc)
+                    self.originalFields[r, j] = field
+                    # a file rewritten after an overflow no longer has the initial layout
+                    if row >= len(lines) or len(field) != end - start or self.shifted[f]:
+                        continue
+                    lineOffset = len(line[:start].encode(m.file_enc))
+                    if lines[row][lineOffset:lineOffset + len(field)] == field:
+                        self.offsets[r, j] = lineStarts[row] + lineOffset
+
+    def isDirty(self):
+        # changes to write, or changes of the previous write to be set back
+        return bool(self.changed.any() or self.onDisk.any())
+
+    def changedFiles(self):
+        return np.unique(self.rowFile[self.changed.any(axis=1)])
+
+    def write(self):
+        """writes every changed file once and discards the changes
+
+        Return: list of the written file names
+        """
+        if self.offsets is None:
+            self.compile()
+
+        fields = {}
+        rewrite = self.shifted.copy()
+        for j in self.order:
+            rows = np.flatnonzero(self.changed[:, j])
+            if len(rows) == 0:
+                continue
+            row, col1, col2, dig = self.parInfo[self.parNames[j]]
+            width = col2 - col1 + 1
+            strings = np.char.rjust(np.char.mod("%" + str(width) + "." + str(dig) + "f", self.newValues[rows, j]), width)
+            fits = (np.char.str_len(strings) == width) & (self.offsets[rows, j] >= 0)
+            rewrite[self.rowFile[rows[~fits]]] = True
+            fields[j] = (rows, strings.tolist())
+
+        # values of the previous write, which are not changed again, are set back
+        restore = self.onDisk & ~self.changed
+        rewrite[self.rowFile[restore.any(axis=1) & (self.offsets < 0).any(axis=1)]] = True
+        touched = np.zeros(self.n_files, dtype=bool)
+        touched[self.rowFile[(self.changed | self.onDisk).any(axis=1)]] = True
+
+        patches = collections.defaultdict(list)
+        texts = {f: self.manipulators[f].textOld for f in np.flatnonzero(touched & rewrite).tolist()}
+        for j, (rows, strings) in fields.items():
+            for r, f, s in zip(rows.tolist(), self.rowFile[rows].tolist(), strings):
+                if f in texts:
+                    row, start, end = self.fieldLayout(j, r)
+                    text = texts[f]
+                    text[row] = text[row][:start] + s + text[row][end:]
+                else:
+                    patches[f].append((self.offsets[r, j], s.encode("ascii")))
+        for r, j in zip(*np.nonzero(restore)):
+            f = self.rowFile[r]
+            if not f in texts:
+                patches[f].append((self.offsets[r, j], self.originalFields[r, j]))
+
+        written = []
+        for f, text in texts.items():
+            m = self.manipulators[f]
+            with open(os.path.join(m.working_dir, m.filename), "w", encoding=m.file_enc) as ffile:
+                ffile.writelines(text)
+            written.append(m.filename)
+        for f, fieldPatches in patches.items():
+            m = self.manipulators[f]
+            patchFile(os.path.join(m.working_dir, m.filename), fieldPatches)
+            written.append(m.filename)
+
+        # a rewritten file no longer has the layout of the edit plan, if a value overflowed
+        self.shifted = rewrite & touched
+        self.onDisk = self.changed.copy()
+        self.reset()
+        return written
+
+    def reset(self):
+        self.newValues[:] = self.values
+        self.changed[:] = False
+        self.order = []
+
+    def setPristine(self):
+        # the files were restored to their initial text by other means
+        self.reset()
+        self.onDisk[:] = False
+        self.shifted[:] = False
+
+
+class AttributeIndex(object):
+    """attributes of all HRUs of a model, read once from the file headers
+
+    For every HRU (".hru" file) the subbasin, landuse, soil and slope class
+    are taken from the header line, the hydrologic group and the texture from
+    line 3 and 7 of the ".sol" file. A constraint of a parameter name
+    (x__<parname>__<ext>__<hydgrp>__<soltext>__<landuse>__<subbsn>__<slope>)
+    then selects the matching files by array comparisons.
+    """
+
+    def __init__(self, working_dir, encoding='latin-1'):
+        self.working_dir = working_dir
+        self.encoding = encoding
+        hruFiles = sorted([f for f in os.listdir(working_dir) if f.endswith(".hru") and f.startswith("0")])
+        self.stems = np.array([f[:-4] for f in hruFiles])
+        self.positions = {stem: i for i, stem in enumerate(self.stems.tolist())}
+
+        subbasin, landuse, soil, slope, hydgrp, soltext = [], [], [], [], [], []
+        for f in hruFiles:
+            header = dict(HEADER_ATTRIBUTE.findall(self.readLines(f, 1)[0]))
+            subbasin.append(int(header.get("Subbasin", -1)))
+            landuse.append(header.get("Luse", "").upper())
+            soil.append(header.get("Soil", ""))
+            slope.append(header.get("Slope", ""))
+            sol = self.readLines(f[:-4] + ".sol", 7)
+            hydgrp.append(sol[2].split(":")[-1].strip().upper() if len(sol) > 2 else "")
+            soltext.append(sol[6].split(":")[-1].strip().upper() if len(sol) > 6 else "")
+
+        self.subbasin = np.array(subbasin, dtype=int)
+        self.landuse = np.array(landuse)
+        self.soil = np.array(soil)
+        self.slope = np.array(slope)
+        self.hydgrp = np.array(hydgrp)
+        self.soltext = np.array(soltext)
+
+    def readLines(self, filename, n):
+        lines = []
+        try:
+            with open(os.path.join(self.working_dir, filename), "r", encoding=self.encoding) as ffile:
+                for line in ffile:
+                    lines.append(line)
+                    if len(lines) == n:
+                        break
+        except OSError:
+            pass
+        return lines or [""]
+
+    @staticmethod
+    def parseSubbasins(text):
+        # "3", "3-9" or "1,3,5-9"
+        subbasins = []
+        for part in text.split(","):
+            if "-" in part:
+                first, last = part.split("-")
+                subbasins.extend(range(int(first), int(last) + 1))
+            elif part.strip():
+                subbasins.append(int(part))
+        return subbasins
+
+    def select(self, hydgrp="", soltext="", landuse="", subbsn="", slope=""):
+        """boolean mask of the HRUs matching all given constraints
+
+        Empty constraints match every HRU, several values are separated by
+        commas, e.g. landuse "FRST,PAST" or subbsn "1,3-9".
+        """
+        mask = np.ones(len(self.stems), dtype=bool)
+        for values, text in ((self.hydgrp, hydgrp), (self.soltext, soltext), (self.landuse, landuse),
+                             (self.slope, slope)):
+            if text:
+                mask &= np.isin(values, [t.strip().upper() for t in text.split(",")])
+        if subbsn:
+            mask &= np.isin(self.subbasin, self.parseSubbasins(subbsn))
+        return mask
+
+    def fileMask(self, filenames, *constraints):
+        """selects files by the constraints of select
+
+        HRU level files (e.g. ".gw", ".mgt") match if their HRU matches, subbasin
+        level files (".sub", ".rte") if any of their HRUs matches, basin
+        level files (".bsn", "file.cio") always match.
+
+        Return: boolean mask over filenames
+        """
+        selected = self.select(*constraints)
+        subbasins = np.unique(self.subbasin[selected])
+        mask = np.ones(len(filenames), dtype=bool)
+        for i, filename in enumerate(filenames):
+            stem = filename.split(".")[0]
+            if stem in self.positions:
+                mask[i] = selected[self.positions[stem]]
+            elif len(stem) == 9 and stem.isdigit():
+                mask[i] = int(stem[:5]) in subbasins
+        return mask
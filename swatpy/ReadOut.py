@@ -18,8 +18,15 @@
 """
 
 import os
+import io
+import mmap
 import numpy as np
 
+# bytes of an output file read at once by "streamValues"
+CHUNK_SIZE = 8 * 2 ** 20
+# sidecar index of an output file, e.g. "output.rch.idx"
+INDEX_SUFFIX = ".idx"
+
 """
 __init__        subclass loads corresponding file, afterwards output is read in;
                 calls readAreaSizes;
@@ -34,6 +41,13 @@ readValues      time series of selected output parameters and subbasins or HRUs
                 a subkey (subbasin or HRU), which on his part refers to a
                 list of output values
 
+streamValues    as readValues, but the file is read in chunks of fixed size and
+                the values are returned time step by time step, the memory use
+                does not depend on the size of the file
+
+writeIndex      writes a sidecar index of the time steps next to the output
+                file, readers seek to the requested rows with it
+
 write           writes output values and/or corresponding statistics in a file.
                 File name describes source file and contained parameter.
                 Furthermore subbasin/HRU and aggregation mode ("SUM") respectivly;
@@ -48,24 +62,80 @@ subclasses just have to be called once after each SWAT run.
 """
 
 
+def fixedWidthRows(buffer, firstRow, encoding='latin-1', verify=True):
+    """the data rows of an output file as a 2-D byte array (rows x line length)
+
+    Keyword arguments:
+    verify -- check all bytes of the rows, else only the line ends at the row ends
+    Return: None if the rows differ in length or are not plain ASCII,
+            such files are read line by line
+    """
+    if "\n".encode(encoding) != b"\n":
+        return None
+    start = 0
+    for i in range(firstRow - 1):
+        start = buffer.find(b"\n", start) + 1
+        if start == 0:
+            return np.zeros((0, 1), dtype=np.uint8)
+    if start >= len(buffer):
+        return np.zeros((0, 1), dtype=np.uint8)
+    width = buffer.find(b"\n", start) + 1 - start
+    if width <= 0 or (len(buffer) - start) % width != 0:
+        return None
+    n_rows = (len(buffer) - start) // width
+    # every row ends at a multiple of the width and there are no other line ends
+    if verify and buffer.count(b"\n", start) != n_rows:
+        return None
+    rows = np.frombuffer(buffer, dtype=np.uint8, offset=start).reshape(n_rows, width)
+    if (rows[:, -1] != 10).any() or (verify and rows.max() >= 128):
+        return None
+    return rows
+
+
+def fixedWidthColumn(rows, span, dtype=float, index=None):
+    # decodes the field span (col1, col2) of all rows (or the rows index) at once,
+    # as float() / int() of textRow[col1:col2], no other bytes of the rows are touched
+    col1, col2 = span
+    n_rows = rows.shape[0] if index is None else len(index)
+    field = np.full((n_rows, col2 - col1), 32, dtype=np.uint8)
+    available = max(0, min(col2, rows.shape[1]) - col1)
+    if index is None:
+        field[:, :available] = rows[:, col1:col1 + available]
+    else:
+        field[:, :available] = rows[index, col1:col1 + available]
+    # line ends within the span count as whitespace
+    field[(field == 10) | (field == 13)] = 32
+    return field.view("S%d" % (col2 - col1)).ravel().astype(dtype)
+
+
 class OutputFileManipulator(object):
 
     # calls everthing else (open inputfile command in subclass)
     # method=("sum", "indi" or "sum & indi" or "skip"; onlyStatistics=(True or False)
-    def __init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint='day', stats_dir=None, encoding='latin-1'):
+    # parsed=(ParsedOutput of the run, the values are taken from there instead of reading the file again)
+    # chunkSize=(bytes, the file is streamed in chunks instead of being loaded as a whole)
+    # steps=((first, last) time steps of the returned values, e.g. (0, 365) for the first year of daily output)
+    def __init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint='day', stats_dir=None, encoding='latin-1', parsed=None, chunkSize=None, steps=None):
         # set file and folder paths
         self.working_dir = working_dir
         self.stats_dir=stats_dir
         self.iprint=iprint
         self.file_enc = encoding
-        # read from input file
-        self.textOld = self.inputFile.readlines()
-        self.inputFile.close()
-        # calculate stats
-        self.areaSizes = self.readAreaSizes(areasList)
-        self.outValues = self.readValues(outList, areasList)
+        windowed = False
+        if not chunkSize is None:
+            self.outValues = self.streamedValues(outList, areasList, chunkSize)
+        elif parsed is None:
+            # map the input file, only the requested rows and columns are decoded
+            self.loadOutput(mapped=True)
+            # calculate stats
+            self.areaSizes = self.readAreaSizes(areasList)
+            self.outValues = self.readValues(outList, areasList, steps)
+            self.releaseOutput()
+            windowed = not steps is None
+        else:
+            self.areaSizes, self.outValues = parsed.read(self.__class__, outList, areasList)
 
-        if self.iprint == 'month' or self.iprint == 0:
+        if not windowed and (self.iprint == 'month' or self.iprint == 0):
             for outName in outList:
                 for area in areasList:
                     new_list = []
@@ -75,15 +145,168 @@ class OutputFileManipulator(object):
                         else:
                             new_list.append(self.outValues[outName][area][i])
                     self.outValues[outName][area] = new_list
+        if not windowed and not steps is None:
+            for outName in outList:
+                for area in areasList:
+                    self.outValues[outName][area] = self.outValues[outName][area][steps[0]:steps[1]]
 
         # write stats out
         if not method == 'skip':
             self.write(method, onlyStatistics, daysSkip)
 
+    def loadOutput(self, mapped=False):
+        # the file is read once as bytes or mapped into memory (mapped, see releaseOutput);
+        # the data rows are decoded column wise as arrays, only files with rows of
+        # differing length are split into lines
+        with open(os.path.join(self.working_dir, self.outputFile), "rb") as f:
+            st = os.fstat(f.fileno())
+            if mapped and st.st_size > 0:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.buffer = f.read()
+        self.areas = None
+        self.layout = None
+        index = self.readIndex(st)
+        if not index is None:
+            # the time steps are found from the index instead of checking the rows
+            offsets, areas, width = index["offsets"], index["areas"], int(index["width"])
+            self.rows = np.frombuffer(self.buffer, dtype=np.uint8, count=len(offsets) * len(areas) * width,
+                                      offset=int(offsets[0])).reshape(len(offsets) * len(areas), width)
+            self.layout = (areas, len(offsets))
+        else:
+            self.rows = fixedWidthRows(self.buffer, self.outInfo["firstRow"], self.file_enc, not mapped)
+        if self.rows is None:
+            self.textOld = io.TextIOWrapper(io.BytesIO(self.buffer), encoding=self.file_enc).readlines()
+
+    def indexPath(self):
+        return os.path.join(self.working_dir, self.outputFile + INDEX_SUFFIX)
+
+    def readIndex(self, st):
+        # the sidecar index written by writeIndex, None if missing or not written for this file (st)
+        try:
+            with np.load(self.indexPath(), allow_pickle=False) as data:
+                index = {key: data[key] for key in data.files}
+        except (OSError, KeyError, ValueError):
+            return None
+        if int(index["size"]) != st.st_size or int(index["mtime"]) != st.st_mtime_ns or len(index["offsets"]) == 0:
+            return None
+        end = int(index["offsets"][0]) + len(index["offsets"]) * len(index["areas"]) * int(index["width"])
+        if end != st.st_size:
+            return None
+        return index
+
+    def writeIndex(self):
+        """writes the sidecar index of the loaded output file
+
+        The index holds the byte offset of each time step and the areas of a
+        time step in the order of their rows. Later loads of the unchanged file
+        find the requested rows from it without checking the rows of the file.
+        Return: path of the index, None if the rows are not ordered by time step
+        """
+        layout = None if self.rows is None else self.blockLayout()
+        if layout is None:
+            return None
+        areas, n_steps = layout
+        width = self.rows.shape[1]
+        start = len(self.buffer) - self.rows.size
+        st = os.stat(os.path.join(self.working_dir, self.outputFile))
+        path = self.indexPath()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, offsets=start + np.arange(n_steps, dtype=np.int64) * len(areas) * width, areas=areas,
+                     width=width, size=st.st_size, mtime=st.st_mtime_ns)
+        os.replace(tmp_path, path)
+        return path
+
+    def releaseOutput(self):
+        # closes a mapped file, SWAT may overwrite it afterwards
+        buffer = self.buffer
+        self.buffer = None
+        self.rows = None
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
+
+    def blockLayout(self):
+        """areas of the first time step and number of time steps
+
+        SWAT writes the same areas in the same order for every time step, this
+        is checked on the bytes of the area field only, no row is decoded.
+        Return: (areas array, number of time steps), None for other row orders
+        """
+        if self.layout is None and len(self.rows) > 0:
+            self.layout = False
+            col1, col2 = self.outInfo["area"]
+            field = self.rows[:, col1:min(col2, self.rows.shape[1])]
+            n_rows = len(field)
+            # the first time step ends with the first repeat of the first area
+            repeat = np.ones(n_rows, dtype=bool)
+            for k in range(field.shape[1]):
+                repeat &= field[:, k] == field[0, k]
+            starts = np.flatnonzero(repeat)
+            blockSize = int(starts[1]) if len(starts) > 1 else n_rows
+            if blockSize > 0 and n_rows % blockSize == 0:
+                n_steps = n_rows // blockSize
+                periodic = True
+                for k in range(field.shape[1]):
+                    periodic &= bool((field[:, k].reshape(n_steps, blockSize) == field[:blockSize, k]).all())
+                areas = fixedWidthColumn(self.rows[:blockSize], self.outInfo["area"], int)
+                if periodic and len(np.unique(areas)) == blockSize:
+                    self.layout = (areas, n_steps)
+        return self.layout if self.layout else None
+
+    def areaColumn(self):
+        if self.areas is None:
+            self.areas = fixedWidthColumn(self.rows, self.outInfo["area"], int)
+            # rows grouped by area, in file order within each area
+            self.areaOrder = np.argsort(self.areas, kind="stable")
+            self.sortedAreas = self.areas[self.areaOrder]
+        return self.areas
+
+    def areaRows(self, area, steps=None):
+        # indices of the rows of an area, in file order (only of the time steps steps)
+        layout = self.blockLayout()
+        if not layout is None:
+            areas, n_steps = layout
+            offset = np.flatnonzero(areas == area)
+            if len(offset) == 0:
+                return np.zeros(0, dtype=int)
+            if steps is None:
+                steps = np.arange(n_steps)
+            return int(offset[0]) + len(areas) * steps
+        self.areaColumn()
+        first = np.searchsorted(self.sortedAreas, area, "left")
+        last = np.searchsorted(self.sortedAreas, area, "right")
+        if steps is None:
+            return self.areaOrder[first:last]
+        return self.areaOrder[first:last][steps]
+
+    def keptSteps(self, n_steps, steps):
+        # time steps of an area in the window steps=(first, last) of the values after the monthly filter of __init__
+        kept = np.arange(n_steps)
+        if self.iprint == 'month' or self.iprint == 0:
+            kept = kept[((kept + 1) % 12 != 0) & (kept < n_steps - 1)]
+        return kept[steps[0]:steps[1]]
+
     def readAreaSizes(self, areasList):
         areaSizes = {}
         for area in areasList:
             areaSizes[area] = None
+        if not self.rows is None:
+            # as the line by line scan below: the first size of each area,
+            # until the first area is found a second time
+            first = {}
+            breakAt = len(self.rows)
+            for area in areaSizes:
+                index = self.areaRows(area)[:2]
+                if len(index) > 0:
+                    first[area] = int(index[0])
+                if len(index) > 1:
+                    breakAt = min(breakAt, int(index[1]))
+            found = [area for area in first if first[area] < breakAt]
+            sizes = fixedWidthColumn(self.rows, self.outInfo["areaSize"], index=[first[area] for area in found])
+            for area, size in zip(found, sizes.tolist()):
+                areaSizes[area] = size
+            return areaSizes
         row = self.outInfo["firstRow"] - 1
         for textRow in self.textOld[row:]:
             col1, col2 = self.outInfo["area"]
@@ -96,12 +319,29 @@ class OutputFileManipulator(object):
                     break
         return areaSizes
 
-    def readValues(self, outList, areasList):
+    # steps=((first, last) window of the time steps, after the monthly filter of __init__ which is applied here already)
+    def readValues(self, outList, areasList, steps=None):
         outValues = {}
         for outName in outList:
             outValues[outName] = {}
             for area in areasList:
                 outValues[outName][area] = []
+        if not self.rows is None:
+            areaRows = []
+            for area in self.areaSizes:
+                if steps is None:
+                    areaRows.append(self.areaRows(area))
+                else:
+                    areaRows.append(self.areaRows(area, self.keptSteps(len(self.areaRows(area)), steps)))
+            bounds = np.cumsum([0] + [len(index) for index in areaRows])
+            selected = np.concatenate(areaRows) if areaRows else np.zeros(0, dtype=int)
+            for outName in outValues:
+                # only the byte spans of the requested columns of the selected rows are decoded
+                values = fixedWidthColumn(self.rows, self.outInfo[outName], index=selected)
+                for i, area in enumerate(self.areaSizes):
+                    if area in outValues[outName]:
+                        outValues[outName][area] = values[bounds[i]:bounds[i + 1]].tolist()
+            return outValues
         row = self.outInfo["firstRow"] - 1
         for textRow in self.textOld[row:]:
             col1, col2 = self.outInfo["area"]
@@ -110,6 +350,143 @@ class OutputFileManipulator(object):
                 for outName in outValues:
                     col1, col2 = self.outInfo[outName]
                     outValues[outName][area].append(float(textRow[col1:col2]))
+        if not steps is None:
+            for outName in outValues:
+                for area in outValues[outName]:
+                    kept = self.keptSteps(len(outValues[outName][area]), steps).tolist()
+                    outValues[outName][area] = [outValues[outName][area][i] for i in kept]
+        return outValues
+
+    def readChunks(self, chunkSize):
+        # the data rows, chunkSize bytes at a time: (rows as for fixedWidthRows, None) or (None, lines)
+        path = os.path.join(self.working_dir, self.outputFile)
+        if "\n".encode(self.file_enc) != b"\n":
+            with open(path, "r", encoding=self.file_enc) as f:
+                for i in range(self.outInfo["firstRow"] - 1):
+                    f.readline()
+                lines = f.readlines(chunkSize)
+                while len(lines) > 0:
+                    yield None, lines
+                    lines = f.readlines(chunkSize)
+            return
+        with open(path, "rb") as f:
+            for i in range(self.outInfo["firstRow"] - 1):
+                f.readline()
+            rest = b""
+            while True:
+                data = f.read(chunkSize)
+                if len(data) == 0:
+                    data, rest = rest, b""
+                    end = len(data)
+                else:
+                    # a line cut by the chunk end is completed by the next chunk
+                    data = rest + data
+                    end = data.rfind(b"\n") + 1
+                    rest = data[end:]
+                if end > 0:
+                    rows = fixedWidthRows(data[:end], 1, self.file_enc)
+                    if rows is None:
+                        yield None, io.TextIOWrapper(io.BytesIO(data[:end]), encoding=self.file_enc).readlines()
+                    else:
+                        yield rows, None
+                elif len(rest) == 0:
+                    break
+
+    def readChunkValues(self, spans, areasList, chunkSize):
+        # the rows of the requested areas of each chunk: (index in areasList, values of the spans)
+        requested = np.array(areasList, dtype=int)
+        order = np.argsort(requested)
+        for rows, lines in self.readChunks(chunkSize):
+            if rows is None:
+                col1, col2 = self.outInfo["area"]
+                areas = np.array([int(textRow[col1:col2]) for textRow in lines], dtype=int)
+                index = np.flatnonzero(np.isin(areas, requested))
+                values = np.array([[float(lines[i][col1:col2]) for col1, col2 in spans] for i in index.tolist()])
+            else:
+                areas = fixedWidthColumn(rows, self.outInfo["area"], int)
+                index = np.flatnonzero(np.isin(areas, requested))
+                values = np.column_stack([fixedWidthColumn(rows[index], span) for span in spans])
+            values = values.reshape(len(index), len(spans))
+            yield order[np.searchsorted(requested[order], areas[index])], values
+
+    def streamValues(self, outList, areasList, chunkSize=CHUNK_SIZE):
+        """values of the selected output parameters and areas time step by time step
+
+        The file is read chunkSize bytes at a time and only the requested
+        values are kept, so the memory use does not depend on the file size.
+        The n-th row of an area belongs to the n-th time step.
+
+        Keyword arguments:
+        outList -- output parameters
+        areasList -- subbasins or HRUs, duplicates are ignored
+        chunkSize -- bytes read at once
+        Return: generator of arrays (outList x areasList), one per time step,
+                NaN for areas missing in the file; afterwards areaSizes holds
+                the sizes of the areas
+        """
+        areasList = list(dict.fromkeys(areasList))
+        self.areaSizes = dict.fromkeys(areasList)
+        spans = [self.outInfo[outName] for outName in outList] + [self.outInfo["areaSize"]]
+        counts = np.zeros(len(areasList), dtype=int)
+        pending = {}
+        emitted = 0
+        for positions, values in self.readChunkValues(spans, areasList, chunkSize):
+            # time step of each row from the rows of its area read so far
+            order = np.argsort(positions, kind="stable")
+            sortedPositions = positions[order]
+            steps = np.empty(len(positions), dtype=int)
+            steps[order] = (counts[sortedPositions] + np.arange(len(positions))
+                            - np.searchsorted(sortedPositions, sortedPositions))
+            counts += np.bincount(positions, minlength=len(areasList))
+            first = steps == 0
+            for position, size in zip(positions[first].tolist(), values[first, -1].tolist()):
+                self.areaSizes[areasList[position]] = size
+            order = np.argsort(steps, kind="stable")
+            sortedSteps = steps[order]
+            bounds = np.flatnonzero(np.diff(sortedSteps)) + 1
+            for index in np.split(order, bounds):
+                if len(index) == 0 or steps[index[0]] < emitted:
+                    continue
+                step = int(steps[index[0]])
+                if not step in pending:
+                    pending[step] = np.full((len(outList), len(areasList)), np.nan)
+                pending[step][:, positions[index]] = values[index, :-1].T
+            # SWAT writes all areas of a time step before the next one, so
+            # a time step is complete once an area of the next one is found
+            while emitted < counts.max() - 1:
+                yield pending.pop(emitted)
+                emitted += 1
+        for step in range(emitted, max(counts.max(initial=0), emitted)):
+            yield pending.pop(step, np.full((len(outList), len(areasList)), np.nan))
+
+    def fillValues(self, out, outList, areasList, chunkSize=CHUNK_SIZE):
+        """fills a preallocated array with the values of streamValues
+
+        Keyword arguments:
+        out -- array (time steps x outList x areasList), further time steps are not read
+        Return: number of filled time steps
+        """
+        n = 0
+        for values in self.streamValues(outList, areasList, chunkSize):
+            if n == len(out):
+                break
+            out[n] = values
+            n += 1
+        return n
+
+    def streamedValues(self, outList, areasList, chunkSize):
+        # outValues as readValues, from streamValues
+        areas = list(dict.fromkeys(areasList))
+        steps = list(self.streamValues(outList, areas, chunkSize))
+        values = np.array(steps).reshape(len(steps), len(outList), len(areas))
+        outValues = {}
+        for i, outName in enumerate(outList):
+            outValues[outName] = {}
+            for j, area in enumerate(areas):
+                if self.areaSizes[area] is None:
+                    outValues[outName][area] = []
+                else:
+                    outValues[outName][area] = values[:, i, j].tolist()
         return outValues
 
     def write(self, method, onlyStatistics, daysSkip):
@@ -183,6 +560,7 @@ class OutputFileManipulator(object):
 
 
 class rchOutputManipulator(OutputFileManipulator):
+    outputFile = "output.rch"
     outInfo = {"type": ".rch",
                "firstRow": (10),
                "area": (7, 11),
@@ -233,12 +611,12 @@ class rchOutputManipulator(OutputFileManipulator):
                "CMETAL#2": (518, 529),
                "CMETAL#3": (530, 541)}
 
-    def __init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint='day', stats_dir=None, encoding='latin-1'):
-        self.inputFile = open(os.path.join(working_dir, "output.rch"), "r", encoding=encoding)
-        OutputFileManipulator.__init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint, stats_dir, encoding)
+    def __init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint='day', stats_dir=None, encoding='latin-1', parsed=None, chunkSize=None, steps=None):
+        OutputFileManipulator.__init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint, stats_dir, encoding, parsed, chunkSize, steps)
 
 
 class subOutputManipulator(OutputFileManipulator):
+    outputFile = "output.sub"
     outInfo = {"type": ".sub",
                "firstRow": (10),
                "area": (7, 11),
@@ -264,12 +642,12 @@ class subOutputManipulator(OutputFileManipulator):
                "LAT_Q": (185, 194),
                "LATNO3": (195, 204)}
 
-    def __init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint='day', stats_dir=None, encoding='latin-1'):
-        self.inputFile = open(os.path.join(working_dir, "output.sub"), "r", encoding=encoding)
-        OutputFileManipulator.__init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint, stats_dir, encoding)
+    def __init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint='day', stats_dir=None, encoding='latin-1', parsed=None, chunkSize=None, steps=None):
+        OutputFileManipulator.__init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint, stats_dir, encoding, parsed, chunkSize, steps)
 
 
 class hruOutputManipulator(OutputFileManipulator):
+    outputFile = "output.hru"
     outInfo = {"type": ".hru",
                "firstRow": (10),
                "area": (4, 8),
@@ -349,14 +727,13 @@ class hruOutputManipulator(OutputFileManipulator):
                "BACTP": (703, 712),
                "BACTLP": (713, 722)}
 
-    def __init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, stats_dir=None, encoding='latin-1'):
-        self.inputFile = open(os.path.join(working_dir, "output.hru"), "r", encoding=encoding)
-        OutputFileManipulator.__init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, stats_dir, encoding)
+    def __init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint='day', stats_dir=None, encoding='latin-1', parsed=None, chunkSize=None, steps=None):
+        OutputFileManipulator.__init__(self, outList, areasList, method, onlyStatistics, daysSkip, working_dir, iprint, stats_dir, encoding, parsed, chunkSize, steps)
 
 
 class efficiency(rchOutputManipulator):
 
-    def __init__(self, output, area, observed, fileColumn, daysSkip, working_dir, iprint='day', nodata=-9999, encoding='latin-1'):
+    def __init__(self, output, area, observed, fileColumn, daysSkip, working_dir, iprint='day', nodata=-9999, encoding='latin-1', parsed=None):
         self.area = area
         self.daysSkip = daysSkip
         self.output = output
@@ -375,12 +752,13 @@ class efficiency(rchOutputManipulator):
         self.obs_masked = np.ma.masked_where(self.obs == nodata, self.obs)
         self.obsMean = np.mean(self.obs_masked)
 
-        f = open(os.path.join(self.working_dir, "output.rch"), "r", encoding=encoding)
-        self.textOld = f.readlines()
-        f.close()
-
-        self.areaSizes = self.readAreaSizes([self.area])
-        self.outValues = self.readValues([self.output], [self.area])
+        if parsed is None:
+            self.loadOutput(mapped=True)
+            self.areaSizes = self.readAreaSizes([self.area])
+            self.outValues = self.readValues([self.output], [self.area])
+            self.releaseOutput()
+        else:
+            self.areaSizes, self.outValues = parsed.read(self.__class__, [self.output], [self.area])
 
         if self.iprint == 'month' or self.iprint == 0:
             new_list = []
@@ -420,14 +798,16 @@ class efficiency(rchOutputManipulator):
 
 class fluxes(subOutputManipulator):
 
-    def __init__(self, output, areasList, daysSkip, working_dir, iprint='day', stats_dir=None, encoding='latin-1'):
+    def __init__(self, output, areasList, daysSkip, working_dir, iprint='day', stats_dir=None, encoding='latin-1', parsed=None):
         self.working_dir = working_dir
         self.file_enc = encoding
-        inputFile = open(os.path.join(self.working_dir, "output.sub"), "r", encoding=encoding)
-        self.textOld = inputFile.readlines()
-        inputFile.close()
-        self.areaSizes = self.readAreaSizes(areasList)
-        outValues = self.readValues([output], areasList)
+        if parsed is None:
+            self.loadOutput(mapped=True)
+            self.areaSizes = self.readAreaSizes(areasList)
+            outValues = self.readValues([output], areasList)
+            self.releaseOutput()
+        else:
+            self.areaSizes, outValues = parsed.read(self.__class__, [output], areasList)
         self.sumSim = np.zeros(len(outValues[output][areasList[0]][daysSkip:]), float)
         for area in self.areaSizes:
             sim = np.array([float(i) for i in outValues[output][area][daysSkip:]])
@@ -437,3 +817,112 @@ class fluxes(subOutputManipulator):
     def result(self):
         return (np.mean(self.sumSim))
 
+
+def openOutput(readerClass, working_dir, encoding='latin-1'):
+    # a reader of the output file without any requested values, loaded once and
+    # mapped into memory (see releaseOutput), the file is not read by __init__
+    reader = readerClass.__new__(readerClass)
+    reader.working_dir = working_dir
+    reader.stats_dir = None
+    reader.iprint = 'day'
+    reader.file_enc = encoding
+    reader.loadOutput(mapped=True)
+    return reader
+
+
+class ParsedOutput(object):
+    """ output files of one SWAT run, each file is read and parsed once
+
+        Holds the area sizes and the series of all variables and areas
+        requested so far per output file. Readers, "efficiency" and "fluxes"
+        given the same ParsedOutput ("parsed") take their values from here,
+        variables or areas not requested before are read from the already
+        mapped file. Has to be closed and created anew after each SWAT run.
+    """
+
+    readers = {"rch": rchOutputManipulator, "sub": subOutputManipulator, "hru": hruOutputManipulator}
+
+    def __init__(self, working_dir, encoding='latin-1'):
+        self.working_dir = working_dir
+        self.file_enc = encoding
+        self.files = {}
+        self.areaSizes = {}
+        self.outValues = {}
+
+    def file(self, readerClass):
+        # the loaded output file, a reader without any requested values
+        outputFile = readerClass.outputFile
+        if not outputFile in self.files:
+            self.files[outputFile] = openOutput(self.readers[readerClass.outInfo["type"][1:]], self.working_dir,
+                                                self.file_enc)
+            self.areaSizes[outputFile] = {}
+            self.outValues[outputFile] = {}
+        return self.files[outputFile]
+
+    def close(self):
+        # unmaps the output files, e.g. before SWAT overwrites them; the values read so far are dropped
+        for reader in self.files.values():
+            reader.releaseOutput()
+        self.files = {}
+        self.areaSizes = {}
+        self.outValues = {}
+
+    def request(self, out_types):
+        """parses the requested variables and areas, each output file in one go
+
+        Keyword arguments:
+        out_types -- list of (output, variable, area) tuples, output is 'rch', 'sub' or 'hru'
+        """
+        requested = {}
+        for out_type, outName, area in out_types:
+            outList, areasList = requested.setdefault(out_type, ([], []))
+            if outName not in outList:
+                outList.append(outName)
+            if area not in areasList:
+                areasList.append(area)
+        for out_type, (outList, areasList) in requested.items():
+            self.read(self.readers[out_type], outList, areasList)
+
+    def read(self, readerClass, outList, areasList):
+        """area sizes and values as "readAreaSizes" and "readValues" of a reader
+
+        Return: (areaSizes, outValues), outValues holds copies of the stored series
+        """
+        reader = self.file(readerClass)
+        areaSizes = self.areaSizes[reader.outputFile]
+        outValues = self.outValues[reader.outputFile]
+        if any([not area in areaSizes for area in areasList]):
+            # sizes are taken from the first time step for all areas requested so far
+            areaSizes.update(reader.readAreaSizes(list(areaSizes) + [area for area in areasList if not area in areaSizes]))
+        missing = [outName for outName in outList
+                   if not outName in outValues or any([not area in outValues[outName] for area in areasList])]
+        if len(missing) > 0:
+            reader.areaSizes = {area: areaSizes[area] for area in areasList}
+            values = reader.readValues(missing, areasList)
+            for outName in values:
+                outValues.setdefault(outName, {}).update(values[outName])
+        return ({area: areaSizes[area] for area in areasList},
+                {outName: {area: list(outValues[outName][area]) for area in areasList} for outName in outList})
+
+
+def buildOutputIndex(working_dir, outputs=("rch", "sub", "hru"), encoding='latin-1'):
+    """writes the sidecar indices of the output files of a finished run
+
+    The readers of these files seek to the requested time steps and areas with
+    the index as long as the output file is not changed.
+
+    Keyword arguments:
+    outputs -- output files, 'rch', 'sub' and/or 'hru', missing files are skipped
+    Return: list of the written index paths
+    """
+    paths = []
+    for out_type in outputs:
+        readerClass = ParsedOutput.readers[out_type]
+        if not os.path.exists(os.path.join(working_dir, readerClass.outputFile)):
+            continue
+        reader = openOutput(readerClass, working_dir, encoding)
+        path = reader.writeIndex()
+        reader.releaseOutput()
+        if not path is None:
+            paths.append(path)
+    return paths
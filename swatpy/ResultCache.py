@@ -0,0 +1,122 @@
+# ResultCache.py
+
+""" content-addressed cache of simulation results
+
+    A result is stored under a hash of the base model fingerprint, the SWAT
+    executable, the applied parameter set and the requested outputs, so a
+    parameter set that was simulated before (e.g. revisited by a sampler
+    or repeated by a rerun campaign) is answered from disk without copying
+    the model or launching SWAT.
+
+    Each entry is a ".npz" file holding the output arrays. Entries are
+    evicted least recently used first once max_entries or max_bytes are
+    exceeded; reading an entry refreshes its modification time.
+
+"""
+
+import os
+import json
+import hashlib
+import uuid
+import numpy as np
+
+
+class ResultCache(object):
+
+    # decimals -- optional rounding of the parameter values before hashing,
+    # e.g. to the precision the values are written with into the input files
+    def __init__(self, cache_dir, max_entries=None, max_bytes=None, decimals=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.decimals = decimals
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = self.scanEntries()
+        self.n_entries = len(entries)
+        self.n_bytes = sum([size for path, size, mtime in entries])
+
+    def key(self, model, parameters, outputs):
+        values = {}
+        for name, value in parameters.items():
+            value = float(value)
+            if not self.decimals is None:
+                value = round(value, self.decimals)
+            values[str(name)] = value
+        requested = sorted([list(out_type) for out_type in outputs])
+        text = json.dumps([model.fingerprint(), model.executableFingerprint(), sorted(values.items()), requested])
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".npz")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                out_types = json.loads(str(data["out_types"]))
+                results = {}
+                for i, out_type in enumerate(out_types):
+                    results[tuple(out_type)] = data[str(i)]
+            os.utime(path)
+            return results
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def put(self, key, results):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        out_types = list(results.keys())
+        arrays = {str(i): np.asarray(results[out_type]) for i, out_type in enumerate(out_types)}
+        arrays["out_types"] = np.array(json.dumps([list(out_type) for out_type in out_types]))
+        # write and rename, other processes may read the same cache
+        tmp_path = os.path.join(os.path.dirname(path), f".{uuid.uuid4()}.tmp.npz")
+        np.savez(tmp_path, **arrays)
+        try:
+            # an existing entry is overwritten
+            replaced_size = os.path.getsize(path)
+        except OSError:
+            replaced_size = None
+        os.replace(tmp_path, path)
+        if replaced_size is None:
+            self.n_entries += 1
+        else:
+            self.n_bytes -= replaced_size
+        self.n_bytes += os.path.getsize(path)
+        if self.isFull():
+            self.evict()
+
+    def isFull(self):
+        return ((not self.max_entries is None and self.n_entries > self.max_entries) or
+                (not self.max_bytes is None and self.n_bytes > self.max_bytes))
+
+    def scanEntries(self):
+        entries = []
+        for sub_dir in os.scandir(self.cache_dir):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                if entry.name.endswith(".npz") and not entry.name.startswith("."):
+                    st = entry.stat()
+                    entries.append((entry.path, st.st_size, st.st_mtime_ns))
+        return entries
+
+    def evict(self):
+        # least recently used first
+        entries = sorted(self.scanEntries(), key=lambda entry: entry[2])
+        self.n_entries = len(entries)
+        self.n_bytes = sum([size for path, size, mtime in entries])
+        for path, size, mtime in entries:
+            if not self.isFull():
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.n_entries -= 1
+            self.n_bytes -= size
+
+    def clear(self):
+        for path, size, mtime in self.scanEntries():
+            os.remove(path)
+        self.n_entries = 0
+        self.n_bytes = 0
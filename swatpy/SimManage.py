@@ -8,10 +8,296 @@ import sys
 import subprocess
 import json
 import traceback
+import queue
+import contextlib
+import tempfile
+import itertools
+import concurrent.futures
+import asyncio
+import threading
+import signal
+import time
+import collections
+import collections.abc
+import hashlib
 import chardet
 
 from .FileEdit import fileCioManipulator, bsnManipulator, gwManipulator, solManipulator
-from .FileEdit import hruManipulator, rteManipulator, mgtManipulator, subManipulator
+from .FileEdit import hruManipulator, rteManipulator, mgtManipulator, subManipulator, LazyManipulator, SubbasinTable
+from .ParameterTable import ParameterTable, AttributeIndex
+from .ReadOut import rchOutputManipulator, subOutputManipulator, hruOutputManipulator, ParsedOutput
+
+
+# files written by getFileManipulators, these are always copied into linked working directories
+EDITABLE_FILE_EXTENSIONS = ('.bsn', '.gw', '.sol', '.hru', '.rte', '.sub', '.mgt')
+EDITABLE_FILE_NAMES = ('file.cio', '.swatmodel.json')
+
+# file type -> (manipulator class, file name filter, parameters read by getFileManipulators)
+MANIPULATOR_TYPES = collections.OrderedDict([
+    ("fileCio", (fileCioManipulator, lambda f: f == "file.cio", ["NBYR", "IYR", "IPRINT", "NYSKIP"])),
+    ("bsn", (bsnManipulator, lambda f: f.endswith(".bsn"),
+             ["SURLAG", "SFTMP", "SMTMP", "SMFMX", "SMFMN", "SNOCOVMX", "SNO50COV", "TIMP", "ESCO", "EPCO"])),
+    ("gw", (gwManipulator, lambda f: f.endswith(".gw"),
+            ["GW_DELAY", "ALPHA_BF", "GW_REVAP", "GWQMN", "RCHRG_DP", "REVAPMN"])),
+    ("sol", (solManipulator, lambda f: f.endswith(".sol"),
+             ["SOL_K", "SAND", "CLAY", "SOL_CBN", "SOL_BD", "SOL_AWC", "SOL_CRK"])),
+    ("hru", (hruManipulator, lambda f: f.endswith(".hru") and f.startswith("0"),
+             ["HRU_FR", "ESCO", "EPCO", "OV_N", "CANMX", "SLSUBBSN", "SLSOIL", "LAT_TTIME"])),
+    ("rte", (rteManipulator, lambda f: f.endswith(".rte"), ["CH_N2", "CH_K2", "CH_S2"])),
+    ("sub", (subManipulator, lambda f: f.endswith(".sub") and f.startswith("0"),
+             ["SUB_KM", "CH_L1", "CH_S1", "CH_W1", "CH_K1", "CH_N1", "CO2"])),
+    ("mgt", (mgtManipulator, lambda f: f.endswith(".mgt"), ["CN2"])),
+])
+
+# x__<parname>__<ext> prefixes of parameter names: v replace, r relative, a absolute change
+PARAMETER_CHANGE_HOW = {'v': 's', 'r': '*', 'a': '+'}
+
+OUTPUT_READERS = {'rch': rchOutputManipulator, 'sub': subOutputManipulator, 'hru': hruOutputManipulator}
+
+# SWAT runs in its own process group / session, so that its whole process tree can be killed
+if os.name == 'nt':
+    PROCESS_GROUP_KWARGS = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    PROCESS_GROUP_KWARGS = {'start_new_session': True}
+
+# files (re)written by SWAT itself, these are neither linked nor copied
+SWAT_OUTPUT_FILES = ('input.std', 'fin.fin', 'chan.deg', 'hyd.out', 'watout.dat')
+SWAT_OUTPUT_PREFIXES = ('output', 'cswat_')
+SWAT_OUTPUT_EXTENSIONS = ('.out',)
+
+# inputs SWAT only reads (e.g. weather data), these may be linked, any other file is copied
+LINKABLE_FILE_EXTENSIONS = ('.pcp', '.tmp', '.slr', '.hmd', '.wnd', '.pet', '.wgn', '.chm', '.pnd', '.swq',
+                            '.wus', '.ops', '.sep', '.res', '.lwq', '.wwq', '.fig', '.cst', '.sdr', '.atm')
+
+
+def killProcessTree(process):
+    """kills a SWAT process started with PROCESS_GROUP_KWARGS and all of its children"""
+    try:
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # already gone
+        pass
+
+
+class RunWatchdog(threading.Thread):
+    """kills a running SWAT process tree after timeout seconds or after
+    stall_timeout seconds without progress(), the cause is kept in reason;
+    with a log_file every growth of the file counts as progress"""
+
+    def __init__(self, process, timeout=None, stall_timeout=None, log_file=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.process = process
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.log_file = log_file
+        self.log_size = 0
+        self.reason = None
+        self.started = time.monotonic()
+        self.last_progress = self.started
+        self.poll_interval = min([1.0] + [t / 4.0 for t in (timeout, stall_timeout) if not t is None])
+        self._stopped = threading.Event()
+
+    def progress(self):
+        self.last_progress = time.monotonic()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.wait(self.poll_interval):
+            if not self.log_file is None:
+                log_size = os.path.getsize(self.log_file)
+                if log_size != self.log_size:
+                    self.log_size = log_size
+                    self.progress()
+            now = time.monotonic()
+            if not self.timeout is None and now - self.started > self.timeout:
+                self.reason = 'timeout'
+            elif not self.stall_timeout is None and now - self.last_progress > self.stall_timeout:
+                self.reason = 'stalled'
+            else:
+                continue
+            killProcessTree(self.process)
+            return
+
+
+class RunLogHandler(object):
+    """handles the stdout lines of a SWAT run
+
+    Lines are only decoded if they are printed, kept or passed to log_callback.
+    With log_lines only the last log_lines lines are kept in a ring buffer.
+    "Executing year" lines are turned into progress_callback calls with a dict
+    of 'year', 'n_years', 'elapsed' and 'eta' (seconds, None for the first year).
+    """
+
+    def __init__(self, capture_logs=True, silent=False, log_lines=None, progress_callback=None, n_years=None,
+                 log_callback=None):
+        if not log_lines is None:
+            self.logs = collections.deque(maxlen=log_lines)
+        elif capture_logs:
+            self.logs = []
+        else:
+            self.logs = None
+        self.silent = silent
+        self.progress_callback = progress_callback
+        self.log_callback = log_callback
+        self.n_years = n_years
+        self.started = time.monotonic()
+        self.decode = not silent or not self.logs is None or not log_callback is None
+
+    def feed(self, b_line):
+        if not self.progress_callback is None and b'Executing year' in b_line:
+            self.reportProgress(b_line)
+        if self.decode:
+            line = b_line.decode().strip()
+            if not self.silent:
+                print(line)
+            if not self.log_callback is None:
+                self.log_callback(line)
+            if not self.logs is None:
+                self.logs.append(line)
+
+    def reportProgress(self, b_line):
+        try:
+            year = int(b_line.split(b'Executing year')[1].split()[0])
+        except (IndexError, ValueError):
+            return
+        elapsed = time.monotonic() - self.started
+        eta = None
+        if year > 1 and not self.n_years is None:
+            eta = elapsed / (year - 1) * (self.n_years - year + 1)
+        self.progress_callback({'year': year, 'n_years': self.n_years, 'elapsed': elapsed, 'eta': eta})
+
+    def append(self, line):
+        if self.logs is None:
+            self.logs = []
+        self.logs.append(line)
+
+    def text(self):
+        if self.logs is None:
+            return ''
+        return '\n'.join(self.logs)
+
+
+class SwatRun(object):
+    """state of one run of SWAT by SwatModel.run or run_async
+
+    run and run_async only start the process and read its output lines; the
+    log handler, the stdout target, the watchdog, the run result and the
+    cleanup of both are handled here.
+    """
+
+    def __init__(self, model, capture_logs=True, silent=False, timeout=None, stall_timeout=None, log_file=None,
+                 log_lines=None, progress_callback=None, log_callback=None):
+        self.model = model
+        # SWAT is started with working_dir as its own cwd, the process wide cwd is never changed,
+        # so that several models can be run from threads or an asyncio loop of one process
+        self.swat_exec = os.path.abspath(os.path.join(model.working_dir, model.swat_exec))
+        self.capture_logs = capture_logs
+        self.silent = silent
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.log_file = log_file
+        self.log_lines = log_lines
+        self.progress_callback = progress_callback
+        self.log_callback = log_callback
+        self.handler = None
+        self.log_fp = None
+        self.process = None
+        self.watchdog = None
+        self.returncode = None
+        model.releaseOutput()
+
+    def open(self):
+        """creates the log handler and opens the log file
+
+        Return: stdout target of the SWAT process
+        """
+        n_years = None
+        if not self.progress_callback is None:
+            n_years = getattr(self.model, 'n_years_simulated', None)
+            if n_years is None:
+                fileCio = fileCioManipulator('file.cio', ["NBYR"], self.model.working_dir,
+                                             self.model.model_text_encoding)
+                n_years = int(fileCio.parValue['NBYR'][0])
+        self.handler = RunLogHandler(self.capture_logs, self.silent, self.log_lines, self.progress_callback, n_years,
+                                     self.log_callback)
+
+        if self.log_file is None:
+            return subprocess.PIPE
+        if self.log_file == subprocess.DEVNULL:
+            if not self.stall_timeout is None:
+                raise ValueError("stall detection needs the SWAT output, use a log file instead of DEVNULL")
+            return subprocess.DEVNULL
+        self.log_fp = open(self.log_file, 'wb')
+        return self.log_fp
+
+    def start(self, process):
+        """watches the started process
+
+        Return: True if its output lines are to be passed to feed
+        """
+        self.process = process
+        if not self.timeout is None or not self.stall_timeout is None:
+            self.watchdog = RunWatchdog(process, self.timeout, self.stall_timeout,
+                                        None if self.log_fp is None else self.log_file)
+            self.watchdog.start()
+        return self.log_file is None
+
+    def feed(self, b_line):
+        if not self.watchdog is None:
+            self.watchdog.progress()
+        self.handler.feed(b_line)
+
+    def finish(self, returncode):
+        self.returncode = returncode
+        killed = None
+        if not self.watchdog is None:
+            self.watchdog.stop()
+            killed = self.watchdog.reason
+
+        model = self.model
+        if not killed is None:
+            model.last_run_succesful = False
+            model.last_run_status = killed
+            message = f"SWAT process tree killed ({killed}) in {model.working_dir}"
+            print(message)
+            self.handler.append(message)
+        elif returncode == 0:
+            model.last_run_succesful = True
+            model.last_run_status = 'success'
+        else:
+            model.last_run_succesful = False
+            model.last_run_status = 'failed'
+        model.last_run_logs = self.handler.text()
+
+    def fail(self, e):
+        self.model.last_run_succesful = False
+        self.model.last_run_status = 'error'
+        print(repr(e))
+        traceback.print_exc(file=sys.stdout)
+        self.model.last_run_logs = repr(e)
+
+    def close(self):
+        """stops the watchdog, kills SWAT if it is still running and closes the log file
+
+        SWAT is still running after an exception (e.g. raised by a callback), a
+        KeyboardInterrupt or a cancellation, these two are raised again afterwards.
+
+        Return: True if the killed process still has to be waited for
+        """
+        if not self.watchdog is None:
+            self.watchdog.stop()
+        killed = not self.process is None and self.process.returncode is None
+        if killed:
+            killProcessTree(self.process)
+        if not self.log_fp is None:
+            self.log_fp.close()
+        return killed
 
 
 class SwatModel(object):
@@ -23,8 +309,15 @@ class SwatModel(object):
         self.swat_exec = 'swat_64rel.exe'
         self.model_text_encoding = 'utf-8'
         self.last_run_succesful = False
+        self.last_run_status = None
         self.last_run_logs = ''
         self.fileManipulators = None
+        self.last_written_files = []
+        self.written_files = set()
+        self.pristine_files = None
+        self.last_output = None
+        self.model_fingerprint = None
+        self.exec_fingerprint = None
 
     
     def is_runnable(self):
@@ -77,13 +370,75 @@ class SwatModel(object):
             return enc
 
 
+    # no self
+    # pylint: disable=no-self-argument
+    def isEditableFile(filename):
+        return filename in EDITABLE_FILE_NAMES or filename.endswith(EDITABLE_FILE_EXTENSIONS)
+
+
+    # no self
+    # pylint: disable=no-self-argument
+    def isOutputFile(filename):
+        return (filename.startswith(SWAT_OUTPUT_PREFIXES) or filename.endswith(SWAT_OUTPUT_EXTENSIONS) or
+                filename in SWAT_OUTPUT_FILES)
+
+
+    # no self
+    # pylint: disable=no-self-argument
+    def materializeTxtInOut(txtInOut, target_dir, link=None):
+        """creates a model working directory from a TxtInOut directory
+
+        Keyword arguments:
+        link -- None copies every file, 'symlink' or 'hardlink' links the inputs SWAT only
+                reads (see LINKABLE_FILE_EXTENSIONS) and copies all other files, SWAT output
+                files are skipped, so SWAT never writes through a link into the source
+        Return: number of linked files
+        """
+
+        if link is None:
+            shutil.copytree(Path(txtInOut), Path(target_dir))
+            return 0
+
+        if link not in ('symlink', 'hardlink'):
+            raise ValueError(f"unknown link mode {link}, use 'symlink' or 'hardlink'")
+
+        src_dir = os.path.abspath(txtInOut)
+        os.makedirs(target_dir, exist_ok=True)
+        n_linked = 0
+        with os.scandir(src_dir) as it:
+            for entry in it:
+                src = os.path.join(src_dir, entry.name)
+                dst = os.path.join(target_dir, entry.name)
+                if entry.is_dir():
+                    shutil.copytree(src, dst)
+                elif SwatModel.isEditableFile(entry.name):
+                    shutil.copy2(src, dst)
+                elif SwatModel.isOutputFile(entry.name):
+                    continue
+                elif not entry.name.endswith(LINKABLE_FILE_EXTENSIONS):
+                    shutil.copy2(src, dst)
+                else:
+                    try:
+                        if link == 'symlink':
+                            os.symlink(src, dst)
+                        else:
+                            os.link(src, dst)
+                        n_linked += 1
+                    except OSError:
+                        # e.g. hardlink across devices or no symlink privilege on Windows
+                        shutil.copy2(src, dst)
+        return n_linked
+
+
     # FACTORY method, no self
     # pylint: disable=no-self-argument
-    def initFromTxtInOut(txtInOut, copy=None, target_dir=None, swat_version='2012', force=False):
+    def initFromTxtInOut(txtInOut, copy=None, target_dir=None, swat_version='2012', force=False, link=None):
         """initialise the SwatModel working object from loading a SWAT 2012 TxtInOut directory
         
         Keyword arguments:
-        argument -- description
+        copy -- create a copy of the TxtInOut (True) or work in the existing folder (False)
+        link -- with copy=True, 'symlink' or 'hardlink' the inputs that are never edited
+                instead of copying them (see materializeTxtInOut)
         Return: return_description
         """
 
@@ -111,7 +466,7 @@ class SwatModel(object):
                     if is_empty or force:
                         print('... forcing init here and copy - not fully implemented')
                         try:
-                            shutil.copytree(Path(txtInOut), test_path)
+                            SwatModel.materializeTxtInOut(txtInOut, test_path, link)
                             print('copying to working directory: ' + os.path.abspath(test_path))
                             config['working_dir'] = str(os.path.abspath(test_path))
 
@@ -127,7 +482,7 @@ class SwatModel(object):
                     try:
                         test_path = Path(os.path.join(os.getcwd(), target_dir))
                         # assuming relative to here
-                        shutil.copytree(Path(txtInOut), test_path)
+                        SwatModel.materializeTxtInOut(txtInOut, test_path, link)
                         print('creating working directory: ' + os.path.abspath(test_path))
                         config['working_dir'] = str(os.path.abspath(test_path))
 
@@ -140,7 +495,7 @@ class SwatModel(object):
                 temp_id = uuid.uuid1()
                 try:
                     test_path = Path(os.path.join(os.getcwd(), f"swat_{temp_id}"))
-                    shutil.copytree(Path(txtInOut), test_path)
+                    SwatModel.materializeTxtInOut(txtInOut, test_path, link)
                     print('creating working directory: ' + os.path.abspath(test_path))
                     config['working_dir'] = str(os.path.abspath(test_path))
                     
@@ -178,6 +533,8 @@ class SwatModel(object):
         model.model_text_encoding = config['model_text_encoding']
         
         model.is_runnable()
+        config['swat_exec'] = model.swat_exec
+        config.update(model.metadataStates())
 
         # TODO write self.metadata_obj = os.path.join(working_dir, '.swatmodel.json')
         with open(os.path.join(model.working_dir, '.swatmodel.json'), 'w') as fp:
@@ -187,11 +544,13 @@ class SwatModel(object):
 
     # FACTORY method, no self
     # pylint: disable=no-self-argument
-    def loadModelFromDirectory(target_dir):
+    def loadModelFromDirectory(target_dir, trust_metadata=True):
         """initialise the SwatModel working object from the metadata file from existing working directory
         
         Keyword arguments:
-        argument -- description
+        trust_metadata -- reuse the text encoding and the resolved executable stored in the metadata
+                          as long as file.cio and the executable are unchanged (size and mtime),
+                          chardet, the executable lookup and the metadata rewrite are skipped then
         Return: return_description
         """
         
@@ -232,70 +591,520 @@ class SwatModel(object):
         # executable should be discovered or provided
         model.swat_exec = config['swat_exec']
         model.swat_version = config['swat_version']
-        
-        config['model_text_encoding'] = SwatModel.guess_model_text_encoding(model.working_dir)
-        model.model_text_encoding = config['model_text_encoding']
-        
-        model.is_runnable()
 
-        # TODO write self.metadata_obj = os.path.join(working_dir, '.swatmodel.json')
-        with open(os.path.join(model.working_dir, '.swatmodel.json'), 'w') as fp:
-            json.dump(config, fp)
+        states = model.metadataStates()
+        update_meta = False
+
+        if trust_metadata and not states['file_cio_state'] is None and config.get('file_cio_state') == states['file_cio_state']:
+            model.model_text_encoding = config['model_text_encoding']
+        else:
+            config['model_text_encoding'] = SwatModel.guess_model_text_encoding(model.working_dir)
+            model.model_text_encoding = config['model_text_encoding']
+            update_meta = True
+
+        if (trust_metadata and not states['swat_exec_state'] is None and os.path.isabs(model.swat_exec)
+                and config.get('swat_exec_state') == states['swat_exec_state'] and os.access(model.swat_exec, os.X_OK)):
+            pass
+        else:
+            model.is_runnable()
+            config['swat_exec'] = model.swat_exec
+            update_meta = True
+
+        if update_meta:
+            config.update(model.metadataStates())
+            # TODO write self.metadata_obj = os.path.join(working_dir, '.swatmodel.json')
+            with open(os.path.join(model.working_dir, '.swatmodel.json'), 'w') as fp:
+                json.dump(config, fp)
  
         return model
+
+
+    def metadataStates(self):
+        # (size, mtime) of file.cio and the executable, validates the metadata on load
+        states = {'file_cio_state': None, 'swat_exec_state': None}
+        for key, path in (('file_cio_state', os.path.join(self.working_dir, 'file.cio')),
+                          ('swat_exec_state', os.path.join(self.working_dir, self.swat_exec))):
+            try:
+                st = os.stat(path)
+                states[key] = [st.st_size, st.st_mtime_ns]
+            except OSError:
+                pass
+        return states
     
 
-    def run(self, capture_logs=True, silent=False):
+    def run(self, capture_logs=True, silent=False, timeout=None, stall_timeout=None,
+            log_file=None, log_lines=None, progress_callback=None):
+        """runs SWAT in the working directory
+
+        Keyword arguments:
+        timeout -- wall-clock limit of the run in seconds
+        stall_timeout -- limit in seconds for SWAT printing no output at all
+        log_file -- path or subprocess.DEVNULL, SWAT output is redirected there instead of
+                    being handled line by line in Python (stall detection watches the file size)
+        log_lines -- keep only the last log_lines lines in last_run_logs
+        progress_callback -- called with a dict of 'year', 'n_years', 'elapsed' and 'eta' (seconds)
+                             for every "Executing year" line
+        On timeout or stall the whole SWAT process tree is killed, last_run_succesful is False
+        and last_run_status is 'timeout' or 'stalled' (else 'success', 'failed' or 'error').
+        Return: return code of SWAT, None if it could not be started
+        """
 
         # needs metadata swat exec and working_dir
 
-        curdir = os.getcwd()
+        swat_run = SwatRun(self, capture_logs, silent, timeout, stall_timeout, log_file, log_lines, progress_callback)
 
         # subprocess.call / Popen swat_exec, check if return val is 0 or not
-        # yield logs?
         try:
-            os.chdir(self.working_dir)
-            
-            logs = []
-            o = subprocess.Popen([os.path.join(self.working_dir, self.swat_exec)], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            
-            while o.poll() is None:
+            o = subprocess.Popen([swat_run.swat_exec], cwd=self.working_dir, stdout=swat_run.open(),
+                                 stderr=subprocess.STDOUT, **PROCESS_GROUP_KWARGS)
+            if swat_run.start(o):
                 for b_line in o.stdout:
-                    line = b_line.decode().strip()
-                    # sys.stdout.write(line)
-                    if not silent:
-                        print(line)
-                    if capture_logs:
-                        logs.append(line.strip())
-            
-            if o.returncode == 0:
-                self.last_run_succesful = True
-            else:
-                self.last_run_succesful = False
+                    swat_run.feed(b_line)
+            swat_run.finish(o.wait())
+        except Exception as e:
+            swat_run.fail(e)
+        finally:
+            if swat_run.close():
+                swat_run.process.wait()
+
+        return swat_run.returncode
 
-            if capture_logs:
-                self.last_run_logs = '\n'.join(logs)
-            else:
-                self.last_run_logs = ''
 
+    async def run_async(self, capture_logs=True, silent=False, log_callback=None, timeout=None, stall_timeout=None,
+                        log_file=None, log_lines=None, progress_callback=None):
+        """asyncio counterpart of run, SWAT runs as an asyncio subprocess in working_dir
+
+        Keyword arguments:
+        log_callback -- optional callable, called with every decoded log line while SWAT runs
+        see run for the other arguments
+        Return: return code of SWAT, None if it could not be started
+        """
+
+        swat_run = SwatRun(self, capture_logs, silent, timeout, stall_timeout, log_file, log_lines, progress_callback,
+                           log_callback)
+        try:
+            o = await asyncio.create_subprocess_exec(swat_run.swat_exec, cwd=self.working_dir, stdout=swat_run.open(),
+                                                     stderr=asyncio.subprocess.STDOUT, **PROCESS_GROUP_KWARGS)
+            if swat_run.start(o):
+                async for b_line in o.stdout:
+                    swat_run.feed(b_line)
+            swat_run.finish(await o.wait())
         except Exception as e:
-            self.last_run_succesful = False
-            print(repr(e))
-            traceback.print_exc(file=sys.stdout)
-            self.last_run_logs(repr(e))
+            swat_run.fail(e)
         finally:
-            os.chdir(curdir)
+            if swat_run.close():
+                await swat_run.process.wait()
+
+        return swat_run.returncode
 
-        return o.returncode
+
+    def parsedOutput(self):
+        """output files of the last run, each read once and shared by all readers
+
+        pass it as "parsed" to the ReadOut readers, "efficiency" and "fluxes"
+        Return: ParsedOutput, a new one after each run
+        """
+
+        if self.last_output is None:
+            self.last_output = ParsedOutput(self.working_dir)
+        return self.last_output
+
+
+    def releaseOutput(self):
+        # unmaps the output files of the last run, SWAT or a pool checkin may overwrite or remove them
+        if not self.last_output is None:
+            self.last_output.close()
+            self.last_output = None
 
 
     def read_output(self, out_types):
-        # output.rch, output.sub ... 
-        # maybe as tuple (rch, field_x), (rch, field_y)
-        # return as numpy/pandas times series?
+        """reads simulated time series from the output files of the last run
+
+        Keyword arguments:
+        out_types -- list of (output, variable, area) tuples, output is 'rch', 'sub' or 'hru'
+                     e.g. [('rch', 'FLOW_OUT', 1), ('sub', 'LAT_Q', 3)]
+        Return: dict of numpy arrays keyed by the (output, variable, area) tuples
+        """
+
+        if not hasattr(self, 'outprint_code'):
+            fileCio = fileCioManipulator('file.cio', ["IPRINT"], self.working_dir, self.model_text_encoding)
+            self.outprint_code = int(fileCio.parValue['IPRINT'][0])
+        iprint = 'month' if self.outprint_code == 0 else 'day'
+
+        # one reader per output file for all requested variables and areas
+        requested = {}
+        for out_type, outName, area in out_types:
+            outList, areasList = requested.setdefault(out_type, ([], []))
+            if outName not in outList:
+                outList.append(outName)
+            if area not in areasList:
+                areasList.append(area)
+
+        parsed = self.parsedOutput()
+        parsed.request(out_types)
+        readers = {}
+        for out_type, (outList, areasList) in requested.items():
+            readers[out_type] = OUTPUT_READERS[out_type](outList, areasList, 'skip', True, 0, self.working_dir,
+                                                         iprint=iprint, parsed=parsed)
+
+        results = {}
+        for out_type, outName, area in out_types:
+            results[(out_type, outName, area)] = np.array(readers[out_type].outValues[outName][area])
+        return results
+
+
+    def applyParameterSet(self, parameters):
+        """changes the model input files according to a parameter set, each file is written once
+
+        Keyword arguments:
+        parameters -- dict of values keyed by parameter names in the form
+                      x__<parname>__<ext>__<hydgrp>__<soltext>__<landuse>__<subbsn>__<slope>
+                      with x one of v (replace), r (relative) or a (absolute change),
+                      the constraints after <ext> are optional, empty ones match all files,
+                      see AttributeIndex.select
+        Return: list of the written file names
+        """
+
+        with self.parameterTransaction():
+            self.changeParameters(parameters)
+        return self.last_written_files
+
+
+    def changeParameter(self, name, value):
+        # collects the change of one parameter (see applyParameterSet for the name),
+        # the files are only written by commitParameterChanges
+        field_list = name.split('__')
+        changeHow = PARAMETER_CHANGE_HOW[field_list[0]]
+        namePar = field_list[1]
+        manip_ext = field_list[2]
+        constraints = tuple(field_list[3:8])
+        manipulators = self.getFileManipulators()
+        files = manipulators.selectFiles(manip_ext, constraints) if any(constraints) else None
+        manipulators.table(manip_ext).change(namePar, value, changeHow, files)
+
+
+    def changeParameters(self, parameters):
+        for name, value in parameters.items():
+            self.changeParameter(name, value)
+
+
+    def parameterValues(self, manip_ext, namePar, how="first", join=None):
+        """values of a parameter per file, including changes not committed yet
+
+        Keyword arguments:
+        manip_ext -- file type of the parameter, e.g. "sol"
+        namePar -- parameter name, e.g. "SOL_K"
+        how -- aggregation over soil layers, see ParameterTable.fileValues
+        join -- optional file type, the values are aligned to its files by id
+                (e.g. join="hru" gives the SOL_K of the soil of every HRU)
+        Return: array with one value per file, NaN where no value exists
+        """
+
+        manipulators = self.getFileManipulators()
+        table = manipulators.table(manip_ext)
+        values = table.fileValues(namePar, how)
+        if join is None or join == manip_ext:
+            return values
+        index = manipulators.table(join).joinFiles(table)
+        # only files with a partner are indexed, the table may have no files at all
+        joined = np.full(len(index), np.nan)
+        joined[index >= 0] = values[index[index >= 0]]
+        return joined
+
+
+    def setParameterValues(self, manip_ext, namePar, values, changeHow="s"):
+        # collects one change per file (files with NaN values are left out), e.g. derived
+        # from parameterValues:
+        #     slsoil = model.parameterValues("hru", "SLSUBBSN")
+        #     model.setParameterValues("hru", "SLSOIL", slsoil)
+        #     sol_k = model.parameterValues("sol", "SOL_K", how="max", join="hru")
+        #     model.setParameterValues("hru", "LAT_TTIME", 10.4 * slsoil / sol_k)
+        #     model.commitParameterChanges()
+        values = np.asarray(values, dtype=float)
+        self.getFileManipulators().table(manip_ext).change(namePar, values, changeHow, ~np.isnan(values))
+
+
+    def commitParameterChanges(self):
+        """writes all collected parameter changes, every changed file exactly once
+
+        Values changed by the previous commit, which are not changed again,
+        are set back to their initial values.
+
+        Return: list of the written file names
+        """
+
+        written = []
+        for table in self.getFileManipulators().tables.values():
+            if table.isDirty():
+                written += table.write()
+        self.last_written_files = written
+        self.written_files.update(written)
+        self.getFileManipulators().filesChanged(written)
+        return written
+
+
+    def discardParameterChanges(self):
+        for table in self.getFileManipulators().tables.values():
+            table.reset()
+
+
+    @contextlib.contextmanager
+    def parameterTransaction(self):
+        """collects the parameter changes made within the block and writes them at its end
+
+        with model.parameterTransaction():
+            model.changeParameters(parameter_set)
+            model.changeParameter("v__CN2__mgt", 70.0)
+
+        The changes are discarded if the block raises.
+        """
+
+        try:
+            yield self
+        except BaseException:
+            self.discardParameterChanges()
+            raise
+        self.commitParameterChanges()
+
+
+    def run_batch(self, parameter_sets, n_workers=None, outputs=None, root_dir=None, link='symlink',
+                  timeout=None, stall_timeout=None, cache=None):
+        """runs many parameter sets concurrently, each worker process works in its own sandbox
+
+        Keyword arguments:
+        parameter_sets -- list of parameter dicts, see applyParameterSet
+        n_workers -- number of worker processes (default: number of cpus)
+        outputs -- list of (output, variable, area) tuples read after each run, see read_output
+        root_dir -- directory in which the sandboxes are created (default: cwd)
+        link -- materialization of the sandboxes, see materializeTxtInOut
+        timeout, stall_timeout -- limits of each run, see run
+        cache -- optional ResultCache, cached parameter sets are not run again (status 'cached')
+        Return: list of dicts with 'parameters', 'returncode', 'status', 'outputs' and 'error'
+                in the order of parameter_sets
+        """
+
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        if root_dir is None:
+            root_dir = os.getcwd()
+
+        results, keys, to_run = self.cachedBatchResults(cache, parameter_sets, outputs)
+        if len(to_run) == 0:
+            return results
+
+        batch_dir = tempfile.mkdtemp(prefix='swat_batch_', dir=root_dir)
+        base = (self.working_dir, self.swat_exec, self.swat_version, self.model_text_encoding)
+
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(n_workers, len(to_run)),
+                                                        initializer=_batch_worker_init,
+                                                        initargs=(base, batch_dir, link)) as executor:
+                run_results = executor.map(_batch_worker_run, [parameter_sets[i] for i in to_run],
+                                           itertools.repeat(outputs), itertools.repeat((timeout, stall_timeout)))
+                for i, result in zip(to_run, run_results):
+                    results[i] = result
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+        return self.storeBatchResults(cache, parameter_sets, results, keys, to_run)
+
+
+    def cachedBatchResults(self, cache, parameter_sets, outputs):
+        # results answered by the cache, cache keys and the indices of the parameter sets to run,
+        # identical parameter sets are only run once
+        results = [None] * len(parameter_sets)
+        if cache is None:
+            return results, None, list(range(len(parameter_sets)))
+
+        keys = [cache.key(self, parameters, outputs or []) for parameters in parameter_sets]
+        to_run = []
+        first_index = {}
+        for i, key in enumerate(keys):
+            if key in first_index:
+                first = results[first_index[key]]
+                if not first is None:
+                    results[i] = dict(first, parameters=parameter_sets[i])
+                continue
+            first_index[key] = i
+            cached = cache.get(key)
+            if cached is None:
+                to_run.append(i)
+            else:
+                results[i] = {'parameters': parameter_sets[i], 'returncode': 0, 'status': 'cached',
+                              'outputs': cached, 'error': None}
+        return results, keys, to_run
+
+
+    def storeBatchResults(self, cache, parameter_sets, results, keys, to_run):
+        if cache is None:
+            return results
+
+        by_key = {}
+        for i in to_run:
+            result = results[i]
+            by_key[keys[i]] = result
+            if result['status'] == 'success' and not result['outputs'] is None:
+                cache.put(keys[i], result['outputs'])
+
+        # duplicates of parameter sets run within the batch
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                results[i] = dict(by_key[key], parameters=parameter_sets[i])
+        return results
+
+
+    def snapshot(self):
+        """keeps the original bytes of every editable input file in memory, see reset
+
+        Return: number of files in the snapshot
+        """
+
+        self.pristine_files = {}
+        with os.scandir(self.working_dir) as it:
+            for entry in it:
+                if entry.is_file() and SwatModel.isEditableFile(entry.name) and entry.name != self.metadata_obj:
+                    with open(entry.path, 'rb') as ffile:
+                        data = ffile.read()
+                    st = entry.stat()
+                    self.pristine_files[entry.name] = [data, st.st_size, st.st_mtime_ns]
+        self.written_files = set()
+        # the manipulators may have been loaded from other file contents
+        self.fileManipulators = None
+        return len(self.pristine_files)
+
+
+    def reset(self):
+        """restores the editable input files changed since the snapshot from memory
+
+        A file counts as changed if it was written by commitParameterChanges,
+        or if its size or modification time differ from the snapshot (or it is
+        missing), unchanged files are not touched. Edits in place keep the size
+        and may keep a coarse modification time, so the written files are always
+        restored. Without a snapshot one is taken and nothing is restored.
+
+        Return: list of the restored file names
+        """
+
+        if self.pristine_files is None:
+            self.snapshot()
+            return []
+
+        restored = []
+        for filename, state in self.pristine_files.items():
+            path = os.path.join(self.working_dir, filename)
+            try:
+                st = os.stat(path)
+                if st.st_size == state[1] and st.st_mtime_ns == state[2] and not filename in self.written_files:
+                    continue
+            except FileNotFoundError:
+                pass
+            if os.path.islink(path):
+                os.remove(path)
+            with open(path, 'wb') as ffile:
+                ffile.write(state[0])
+            st = os.stat(path)
+            state[1], state[2] = st.st_size, st.st_mtime_ns
+            restored.append(filename)
+
+        self.written_files = set()
+        if not self.fileManipulators is None:
+            self.fileManipulators.setPristine(restored)
+        return restored
+
+
+    def fingerprint(self, force_update=False):
+        """hash of the model inputs, part of the ResultCache keys
+
+        Editable input files (see isEditableFile) are hashed by content, all other inputs
+        by name, size and modification time (copies made with copytree keep these).
+        The fingerprint is computed once, it should be taken from the pristine model.
+        """
+
+        if self.model_fingerprint is None or force_update == True:
+            digest = hashlib.sha256()
+            for filename in sorted(os.listdir(self.working_dir)):
+                path = os.path.join(self.working_dir, filename)
+                if filename == self.metadata_obj or SwatModel.isOutputFile(filename) or not os.path.isfile(path):
+                    continue
+                digest.update(filename.encode('utf-8'))
+                if SwatModel.isEditableFile(filename):
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+                else:
+                    st = os.stat(path)
+                    digest.update(f"{st.st_size}:{st.st_mtime_ns}".encode('utf-8'))
+            self.model_fingerprint = digest.hexdigest()
+
+        return self.model_fingerprint
+
+
+    def executableFingerprint(self):
+        # content hash of the SWAT executable, recomputed when swat_exec changes
+        if self.exec_fingerprint is None or self.exec_fingerprint[0] != self.swat_exec:
+            path = os.path.join(self.working_dir, self.swat_exec)
+            if os.path.isfile(path):
+                digest = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(chunk)
+                self.exec_fingerprint = (self.swat_exec, digest.hexdigest())
+            else:
+                self.exec_fingerprint = (self.swat_exec, self.swat_exec)
+
+        return self.exec_fingerprint[1]
+
+
+    async def run_batch_async(self, parameter_sets, max_concurrent=None, outputs=None, root_dir=None, link='symlink',
+                              timeout=None, stall_timeout=None, cache=None):
+        """asyncio counterpart of run_batch, at most max_concurrent SWAT runs are active at a time
+
+        SWAT runs as asyncio subprocesses of this process, editing the input files and reading
+        the outputs is done in the default executor of the running loop.
+
+        Keyword arguments:
+        max_concurrent -- concurrency limit and number of sandboxes (default: number of cpus)
+        see run_batch for the other arguments and the returned results
+        """
+
+        if max_concurrent is None:
+            max_concurrent = os.cpu_count() or 1
+        if root_dir is None:
+            root_dir = os.getcwd()
+
+        results, keys, to_run = self.cachedBatchResults(cache, parameter_sets, outputs)
+        if len(to_run) == 0:
+            return results
+
+        loop = asyncio.get_running_loop()
+        batch_dir = tempfile.mkdtemp(prefix='swat_batch_', dir=root_dir)
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def run_one(parameters):
+            batch_run = BatchRun(parameters, outputs, timeout, stall_timeout)
+            async with semaphore:
+                # the semaphore guarantees an idle sandbox
+                sandbox = pool.checkout(block=False)
+                try:
+                    await loop.run_in_executor(None, sandbox.applyParameterSet, parameters)
+                    if batch_run.ran(sandbox, await sandbox.run_async(**batch_run.run_kwargs)):
+                        batch_run.setOutputs(await loop.run_in_executor(None, sandbox.read_output, outputs))
+                except Exception as e:
+                    batch_run.fail(e)
+                finally:
+                    await loop.run_in_executor(None, pool.checkin, sandbox)
+            return batch_run.result
+
+        try:
+            pool = await loop.run_in_executor(None, SwatModelPool, self, min(max_concurrent, len(to_run)),
+                                              batch_dir, link)
+            run_results = await asyncio.gather(*[run_one(parameter_sets[i]) for i in to_run])
+            for i, result in zip(to_run, run_results):
+                results[i] = result
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+        return self.storeBatchResults(cache, parameter_sets, results, keys, to_run)
 
-        return np.array([1, 3, 5])
-    
 
     # serialize the mode lconfig from all input files and the model metadata into avro record
     # for binary transport (e.g. network, archive, database ...)
@@ -316,73 +1125,26 @@ class SwatModel(object):
         return model
     
 
-    def getFileManipulators(self, force_update=False):
+    def getFileManipulators(self, force_update=False, lazy=True, n_workers=None, process_types=()):
+        """returns the manipulators of all input file types as a mapping of lists, see MANIPULATOR_TYPES
+
+        A file type is only collected when it is first accessed (e.g. manipulators["gw"]).
+        With lazy=True each file is only parsed when the first parameter is read or changed.
+        With n_workers all files of a type are read and parsed on a thread pool instead
+        (a process pool for the types in process_types, e.g. ("sol",)) when it is accessed,
+        the seconds spent per type are kept in the timings dict of the returned collection.
+        """
         
         if self.fileManipulators is None or force_update == True:
-
-            files=os.listdir(self.working_dir)
-
-            manipulators = {}
-
-            fileCio = []
-            fileCio.append(fileCioManipulator('file.cio', ["NBYR", "IYR", "IPRINT", "NYSKIP"], self.working_dir, self.model_text_encoding))
-            manipulators["fileCio"] = fileCio
-
-            ### here all parameters from the bsn-file are assigned in the dictionary for calibration
-            bsnfiles = [i for i in files if i.endswith(".bsn")]
-            bsn = []
-            for i in bsnfiles:
-                bsn.append(bsnManipulator(i, ["SURLAG","SFTMP","SMTMP","SMFMX", "SMFMN", "SNOCOVMX", "SNO50COV", "TIMP","ESCO","EPCO"], self.working_dir, self.model_text_encoding))
-            manipulators["bsn"] = bsn
-
-            ### here all parameters from the gw-file are assigned in the dictionary for calibration
-            gwfiles = [i for i in files if i.endswith(".gw")]
-            gw = []
-            for i in gwfiles:
-                gw.append(gwManipulator(i, ["GW_DELAY","ALPHA_BF","GW_REVAP","GWQMN","RCHRG_DP","REVAPMN"], self.working_dir, self.model_text_encoding))
-            manipulators["gw"] = gw
-
-            ### here all parameters from the sol-file are assigned in the dictionary for calibration
-            solfiles = [i for i in files if i.endswith(".sol")]
-            sol = []
-            for i in solfiles:
-                if solManipulator(i,[],self.working_dir).landuse != "URBN":
-                    sol.append(solManipulator(i, ["SOL_K","SAND", "CLAY", "SOL_CBN", "SOL_BD", "SOL_AWC", "SOL_CRK"], self.working_dir, self.model_text_encoding))
-            manipulators["sol"] = sol
-
-            ## here all parameters from the hru-file are assigned in the dictionary for calibration
-            hrufiles = [i for i in files if i.endswith(".hru") and i.startswith("0")]
-            hru=[]
-            for i in hrufiles:
-                if i[0].isdigit():
-                    hru.append(hruManipulator(i, ["HRU_FR","ESCO","EPCO","OV_N","CANMX","SLSUBBSN", "SLSOIL", "LAT_TTIME"], self.working_dir, self.model_text_encoding))
-            manipulators["hru"] = hru
-
-            ### here all parameters from the rte-file are assigned in the dictionary for calibration
-            rtefiles = [i for i in files if i.endswith(".rte")]
-            rte = []
-            for i in rtefiles:
-                rte.append(rteManipulator(i, ["CH_N2", "CH_K2", "CH_S2"], self.working_dir, self.model_text_encoding))
-            manipulators["rte"] = rte
-
-            ### here all parameters from the rte-file are assigned in the dictionary for calibration
-            subfiles = [i for i in files if i.endswith(".sub") and i.startswith("0")]
-            sub = []
-            for i in subfiles:
-                sub.append(subManipulator(i, ["SUB_KM", "CH_L1", "CH_S1", "CH_W1", "CH_K1", "CH_N1", "CO2"], self.working_dir, self.model_text_encoding))
-            manipulators["sub"] = sub
-
-            ### here all parameters from the mgt-file are assigned in the dictionary for calibration
-            mgtfiles = [i for i in files if i.endswith(".mgt")]
-            mgt = []
-            for i in mgtfiles:
-                mgt.append(mgtManipulator(i, ["CN2"], self.working_dir, self.model_text_encoding))
-            manipulators["mgt"] = mgt
-
-            self.fileManipulators = manipulators
+            self.fileManipulators = ManipulatorCollection(self, lazy, n_workers, process_types)
 
         # always return
         return self.fileManipulators
+
+
+    @property
+    def manipulators(self):
+        return self.getFileManipulators()
     
 
     def reloadFileManipulators(self):
@@ -444,6 +1206,7 @@ class SwatModel(object):
             'readout_years' : self.readout_years,
             'readout_days' : self.readout_days
         }
+        config.update(self.metadataStates())
 
         
         if update_meta == True:
@@ -456,3 +1219,321 @@ class SwatModel(object):
                 print('Error updating .swatmodel.json model metadata file.')
 
         return config
+
+
+def createManipulator(manipulatorClass, filename, parList, working_dir, encoding, kwargs={}):
+    # module level, so that it can be used on a process pool
+    return manipulatorClass(filename, list(parList), working_dir, encoding, **kwargs)
+
+
+class ManipulatorCollection(collections.abc.Mapping):
+    """mapping of file type to the list of manipulators of a SwatModel
+
+    The file list of a type is only built when the type is first accessed.
+    With lazy=True the lists hold LazyManipulator stand-ins, which parse
+    their file on first use. With n_workers the files of a type are parsed
+    in parallel, on threads or for process_types on processes.
+    """
+
+    def __init__(self, model, lazy=True, n_workers=None, process_types=()):
+        self.model = model
+        self.lazy = lazy
+        self.n_workers = n_workers
+        self.process_types = process_types
+        self.files = None
+        self.manipulators = {}
+        self.tables = {}
+        self.attributes = None
+        self.selections = {}
+        self.subbasins = None
+        self.timings = {}
+        # loaded while files edited by parameter changes were on disk, see SwatModelPool.checkin
+        self.edited = len(model.written_files) > 0
+
+    def __getitem__(self, key):
+        if not key in self.manipulators:
+            if not key in MANIPULATOR_TYPES:
+                raise KeyError(key)
+            self.manipulators[key] = self.load(key)
+        return self.manipulators[key]
+
+    def __iter__(self):
+        return iter(MANIPULATOR_TYPES)
+
+    def __len__(self):
+        return len(MANIPULATOR_TYPES)
+
+    def isLoaded(self, key):
+        return key in self.manipulators
+
+    def table(self, key):
+        # ParameterTable of all files of a type, built once
+        if not key in self.tables:
+            self.tables[key] = ParameterTable(self[key])
+        return self.tables[key]
+
+    def filesChanged(self, filenames):
+        # files rewritten with the same size may keep their modification time
+        if not self.subbasins is None:
+            self.subbasins.invalidate(filenames)
+
+    def setPristine(self, filenames=()):
+        # the files were restored to their pristine text (see SwatModel.reset),
+        # changes not written yet are dropped
+        self.filesChanged(filenames)
+        for table in self.tables.values():
+            table.setPristine()
+        for manipulators in self.manipulators.values():
+            for m in manipulators:
+                if not isinstance(m, LazyManipulator) or m.isLoaded():
+                    m.prepareChangePar()
+
+    def subbasinTable(self):
+        if self.subbasins is None:
+            self.subbasins = SubbasinTable(self.model.working_dir, self.model.model_text_encoding)
+        return self.subbasins
+
+    def attributeIndex(self):
+        if self.attributes is None:
+            self.attributes = AttributeIndex(self.model.working_dir, self.model.model_text_encoding)
+        return self.attributes
+
+    def selectFiles(self, key, constraints):
+        # boolean mask over the files of a type, see AttributeIndex.select
+        if not (key, constraints) in self.selections:
+            self.selections[(key, constraints)] = self.attributeIndex().fileMask(self.table(key).filenames, *constraints)
+        return self.selections[(key, constraints)]
+
+    def preload(self, types=None):
+        # collects (and with n_workers parses) the given or all types at once
+        for key in (MANIPULATOR_TYPES if types is None else types):
+            self[key]
+        return self.timings
+
+    def load(self, key):
+        started = time.perf_counter()
+        if self.files is None:
+            self.files = sorted(os.listdir(self.model.working_dir))
+        manipulatorClass, fileFilter, parList = MANIPULATOR_TYPES[key]
+        filenames = [i for i in self.files if fileFilter(i)]
+        working_dir = self.model.working_dir
+        encoding = self.model.model_text_encoding
+        # the hru files of a subbasin share its parsed .sub file
+        kwargs = {"subTable": self.subbasinTable()} if key == "hru" else {}
+
+        if not self.n_workers is None and self.n_workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                if key == "sol":
+                    # urban soils are not calibrated
+                    landuses = list(executor.map(self.readLanduse, filenames))
+                    filenames = [i for i, landuse in zip(filenames, landuses) if landuse != "URBN"]
+                if not key in self.process_types:
+                    manipulators = list(executor.map(createManipulator, itertools.repeat(manipulatorClass), filenames,
+                                                     itertools.repeat(parList), itertools.repeat(working_dir),
+                                                     itertools.repeat(encoding), itertools.repeat(kwargs)))
+            if key in self.process_types:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                    chunksize = max(1, len(filenames) // (4 * self.n_workers))
+                    manipulators = list(executor.map(createManipulator, itertools.repeat(manipulatorClass), filenames,
+                                                     itertools.repeat(parList), itertools.repeat(working_dir),
+                                                     itertools.repeat(encoding), itertools.repeat(kwargs),
+                                                     chunksize=chunksize))
+                # the manipulators come back with copies of the shared objects
+                for m in manipulators:
+                    for name, value in kwargs.items():
+                        setattr(m, name, value)
+        else:
+            if key == "sol":
+                # urban soils are not calibrated
+                filenames = [i for i in filenames if self.readLanduse(i) != "URBN"]
+            manipulators = []
+            for i in filenames:
+                if self.lazy:
+                    manipulators.append(LazyManipulator(manipulatorClass, i, list(parList), working_dir, encoding,
+                                                        **kwargs))
+                else:
+                    manipulators.append(createManipulator(manipulatorClass, i, parList, working_dir, encoding, kwargs))
+
+        self.timings[key] = time.perf_counter() - started
+        return manipulators
+
+    def readLanduse(self, filename):
+        # landuse from the header line only, as in solManipulator
+        with open(os.path.join(self.model.working_dir, filename), "r", encoding=self.model.model_text_encoding) as f:
+            header = f.readline()
+        try:
+            return header.split(" ")[7].split(":")[1]
+        except IndexError:
+            return None
+
+
+class SwatModelPool(object):
+    """a pool of reusable sandbox copies of a SwatModel working directory
+
+    The sandboxes are copied once from the model working directory. A sandbox
+    is checked out for a run and checked in afterwards, which restores only the
+    files that were changed during the run back to their pristine state and
+    removes files that did not exist in the pristine copy (e.g. output.rch).
+    Editable input files are restored from the in-memory snapshot of the
+    sandbox, see SwatModel.reset.
+
+    Keyword arguments:
+    model -- the SwatModel whose working directory is the pristine source
+    size -- number of sandboxes to create
+    root_dir -- directory in which the sandboxes are created (default: cwd)
+    link -- None, 'symlink' or 'hardlink', see SwatModel.materializeTxtInOut
+    """
+
+    def __init__(self, model, size=1, root_dir=None, link=None):
+        self.model = model
+        self.size = size
+        self.root_dir = os.getcwd() if root_dir is None else root_dir
+        self.link = link
+        self.sandboxes = []
+        self._pristine = {}
+        self._idle = queue.Queue()
+
+        pool_id = uuid.uuid1()
+        for i in range(size):
+            target_dir = os.path.join(self.root_dir, f"swat_pool_{pool_id}_{i}")
+            sandbox = SwatModel.initFromTxtInOut(model.working_dir, copy=True, target_dir=target_dir,
+                                                 swat_version=model.swat_version, link=link)
+            # the sandbox runs the executable and reads the files the way the model does
+            sandbox.swat_exec = model.swat_exec
+            sandbox.model_text_encoding = model.model_text_encoding
+            sandbox.snapshot()
+            self._pristine[sandbox.working_dir] = self.scanFileStates(sandbox.working_dir)
+            self.sandboxes.append(sandbox)
+            self._idle.put(sandbox)
+
+    @staticmethod
+    def scanFileStates(working_dir):
+        # (size, mtime) per file, copytree preserves mtimes so every write changes them
+        states = {}
+        with os.scandir(working_dir) as it:
+            for entry in it:
+                if entry.is_file():
+                    st = entry.stat()
+                    states[entry.name] = (st.st_size, st.st_mtime_ns)
+        return states
+
+    def checkout(self, block=True, timeout=None):
+        return self._idle.get(block=block, timeout=timeout)
+
+    def checkin(self, sandbox):
+        """restores the files changed since checkout and returns the sandbox to the pool
+
+        Return: number of restored or removed files
+        """
+        pristine = self._pristine[sandbox.working_dir]
+        sandbox.releaseOutput()
+        n_restored = len(sandbox.reset())
+        current = self.scanFileStates(sandbox.working_dir)
+
+        for filename, state in current.items():
+            if filename == sandbox.metadata_obj or filename in sandbox.pristine_files:
+                continue
+            if filename not in pristine:
+                os.remove(os.path.join(sandbox.working_dir, filename))
+                n_restored += 1
+            elif state != pristine[filename]:
+                try:
+                    shutil.copy2(os.path.join(self.model.working_dir, filename),
+                                 os.path.join(sandbox.working_dir, filename))
+                    n_restored += 1
+                except shutil.SameFileError:
+                    # linked input, the pristine file itself was changed, by a run or outside the pool
+                    print(f"Warning: linked input {filename} of {self.model.working_dir} was changed, "
+                          f"runs of the pool no longer share the same inputs")
+                    pristine[filename] = state
+
+        for filename in pristine:
+            if filename not in current and not filename in sandbox.pristine_files:
+                shutil.copy2(os.path.join(self.model.working_dir, filename),
+                             os.path.join(sandbox.working_dir, filename))
+                n_restored += 1
+
+        # the manipulators and compiled parameter tables are kept for the next checkout,
+        # unless they were loaded from edited files
+        if not sandbox.fileManipulators is None and sandbox.fileManipulators.edited:
+            sandbox.fileManipulators = None
+
+        self._idle.put(sandbox)
+        return n_restored
+
+    @contextlib.contextmanager
+    def sandbox(self, timeout=None):
+        sandbox = self.checkout(timeout=timeout)
+        try:
+            yield sandbox
+        finally:
+            self.checkin(sandbox)
+
+    def close(self):
+        for sandbox in self.sandboxes:
+            try:
+                shutil.rmtree(sandbox.working_dir)
+            except Exception as e:
+                print(e)
+                print(f"Error removing sandbox {sandbox.working_dir}")
+        self.sandboxes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class BatchRun(object):
+    """the result dict of one parameter set of run_batch or run_batch_async
+
+    The worker process of run_batch and the coroutine of run_batch_async
+    apply the parameters, run SWAT and read the outputs in a sandbox, the
+    result is recorded here.
+    """
+
+    def __init__(self, parameters, outputs, timeout=None, stall_timeout=None):
+        self.outputs = outputs
+        self.result = {'parameters': parameters, 'returncode': None, 'status': None, 'outputs': None, 'error': None}
+        # arguments of SwatModel.run and run_async, the SWAT output is neither printed nor kept
+        self.run_kwargs = {'capture_logs': False, 'silent': True, 'timeout': timeout, 'stall_timeout': stall_timeout}
+
+    def ran(self, sandbox, returncode):
+        """records the run of SWAT
+
+        Return: True if the outputs are to be read (see setOutputs)
+        """
+        self.result['returncode'] = returncode
+        self.result['status'] = sandbox.last_run_status
+        return sandbox.last_run_succesful and bool(self.outputs)
+
+    def setOutputs(self, values):
+        self.result['outputs'] = values
+
+    def fail(self, e):
+        traceback.print_exc(file=sys.stdout)
+        self.result['error'] = repr(e)
+
+
+# sandbox pool of a run_batch worker process
+_batch_pool = None
+
+
+def _batch_worker_init(base, batch_dir, link):
+    global _batch_pool
+    model = SwatModel()
+    model.working_dir, model.swat_exec, model.swat_version, model.model_text_encoding = base
+    _batch_pool = SwatModelPool(model, size=1, root_dir=batch_dir, link=link)
+
+
+def _batch_worker_run(parameters, outputs, limits):
+    batch_run = BatchRun(parameters, outputs, *limits)
+    with _batch_pool.sandbox() as sandbox:
+        try:
+            sandbox.applyParameterSet(parameters)
+            if batch_run.ran(sandbox, sandbox.run(**batch_run.run_kwargs)):
+                batch_run.setOutputs(sandbox.read_output(outputs))
+        except Exception as e:
+            batch_run.fail(e)
+    return batch_run.result
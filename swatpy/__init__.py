@@ -3,6 +3,9 @@
 from .FileEdit import fileCioManipulator, bsnManipulator, subManipulator, hruManipulator
 from .FileEdit import solManipulator, gwManipulator, mgtManipulator, rteManipulator
 
-from .ReadOut import rchOutputManipulator, subOutputManipulator, hruOutputManipulator, efficiency, fluxes
+from .ReadOut import rchOutputManipulator, subOutputManipulator, hruOutputManipulator, efficiency, fluxes, ParsedOutput
+from .ReadOut import buildOutputIndex
 
-from .SimManage import SwatModel
\ No newline at end of file
+from .SimManage import SwatModel, SwatModelPool
+
+from .ParameterTable import AttributeIndex
\ No newline at end of file